@@ -0,0 +1,30 @@
+"""
+Export DeepFace's emotion CNN to ONNX and quantize it to INT8.
+
+test2.py picks up the quantized model automatically when it exists and
+onnxruntime is installed; otherwise it keeps using DeepFace.analyze.
+
+Usage (one-off, needs tf2onnx in addition to requirements.txt):
+    pip install tf2onnx
+    python export_emotion_onnx.py
+"""
+
+import tensorflow as tf
+import tf2onnx
+from deepface import DeepFace
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+FP32_MODEL = "backend/models/emotion.onnx"
+INT8_MODEL = "backend/models/emotion_int8.onnx"
+
+# DeepFace wraps the Keras network in a client object; the graph takes 48x48 grayscale in 0..1
+client = DeepFace.build_model("Emotion", task="facial_attribute")
+keras_model = getattr(client, "model", client)
+
+spec = (tf.TensorSpec((None, 48, 48, 1), tf.float32, name="input"),)
+tf2onnx.convert.from_keras(keras_model, input_signature=spec, output_path=FP32_MODEL)
+print(f"Saved {FP32_MODEL}")
+
+# Dynamic quantization: INT8 weights, activations quantized on the fly (uses VNNI where available)
+quantize_dynamic(FP32_MODEL, INT8_MODEL, weight_type=QuantType.QInt8)
+print(f"Saved {INT8_MODEL}")
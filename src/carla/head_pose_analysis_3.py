@@ -2,37 +2,112 @@
 import carla
 import random
 import time
+import math
+import functools
 import os
 import pygame
 import csv
 
 # --- Imports for Head Pose ---
 import threading
+import multiprocessing as mp
+import queue
 import cv2
 import dlib
 import numpy as np
 
-# --- Helper function to simplify actor type names (Unchanged) ---
+# --- Optional: Numba JIT for the per-tick numeric kernels ---
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    print("Warning: numba not installed. Anomaly/traffic kernels will run as plain Python/NumPy.")
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+DEG2RAD = math.pi / 180.0
+RAD2DEG = 180.0 / math.pi
+
+# --- Head pose states (ints, so the per-frame transition check is cheap) ---
+POSE_ATTENTIVE, POSE_DISTRACTED, POSE_NO_FACE = 0, 1, 2
+POSE_STATUS_MESSAGES = (
+    "[Head Pose] Status: Looking at screen.",
+    "[Head Pose] Status: Looking away.",
+    "[Head Pose] Status: Face not detected.",
+)
+
+# --- Helper function to simplify actor type names ---
+# Checked in order, so earlier entries win (same priority as the original if-chain)
+COLLISION_TYPE_TAGS = (
+    ('vehicle', 'car'),
+    ('pedestrian', 'pedestrian'),
+    ('pole', 'pole'), ('streetlamp', 'pole'),
+    ('wall', 'building/wall'), ('building', 'building/wall'),
+    ('trafficlight', 'traffic_light'),
+    ('static.vegetation', 'vegetation'),
+)
+
+# Blueprint IDs are a small closed set, so each one is only classified once
+@functools.lru_cache(maxsize=128)
 def get_simple_collision_type(actor_type_id):
-    if 'vehicle' in actor_type_id: return 'car'
-    if 'pedestrian' in actor_type_id: return 'pedestrian'
-    if 'pole' in actor_type_id or 'streetlamp' in actor_type_id: return 'pole'
-    if 'wall' in actor_type_id or 'building' in actor_type_id: return 'building/wall'
-    if 'trafficlight' in actor_type_id: return 'traffic_light'
-    if 'static.vegetation' in actor_type_id: return 'vegetation'
+    for substring, tag in COLLISION_TYPE_TAGS:
+        if substring in actor_type_id:
+            return tag
     return 'other'
 
-# --- Anomaly Detection function (Unchanged) ---
+# --- Anomaly Detection function ---
+SPEEDING_THRESHOLD_KMH = 50.0 
+HARD_BRAKE_SPEED_KMH = 30.0 
+STUCK_SPEED_THRESHOLD_KMH = 1.0 
+STUCK_THROTTLE_THRESHOLD = 0.5 
+
+# Indexed by (hard_brake << 2) | (stuck << 1) | speeding, so priority is Hard_Brake > Stuck > Speeding
+ANOMALY_LABELS = ("None", "Excessive_Speeding", "Stuck/Blocked", "Stuck/Blocked",
+                  "Hard_Brake", "Hard_Brake", "Hard_Brake", "Hard_Brake")
+
+@njit(cache=True)
+def anomaly_code(brake, throttle, speed_kmh):
+    code = 0
+    if brake == 1.0 and speed_kmh > HARD_BRAKE_SPEED_KMH: code |= 4
+    if throttle > STUCK_THROTTLE_THRESHOLD and speed_kmh < STUCK_SPEED_THRESHOLD_KMH: code |= 2
+    if speed_kmh > SPEEDING_THRESHOLD_KMH: code |= 1
+    return code
+
 def detect_anomalies(control, speed_kmh):
-    SPEEDING_THRESHOLD_KMH = 50.0 
-    HARD_BRAKE_SPEED_KMH = 30.0 
-    STUCK_SPEED_THRESHOLD_KMH = 1.0 
-    STUCK_THROTTLE_THRESHOLD = 0.5 
-    
-    if control.brake == 1.0 and speed_kmh > HARD_BRAKE_SPEED_KMH: return "Hard_Brake"
-    if control.throttle > STUCK_THROTTLE_THRESHOLD and speed_kmh < STUCK_SPEED_THRESHOLD_KMH: return "Stuck/Blocked"
-    if speed_kmh > SPEEDING_THRESHOLD_KMH: return "Excessive_Speeding"
-    return "None"
+    return ANOMALY_LABELS[anomaly_code(control.brake, control.throttle, speed_kmh)]
+
+# --- Traffic proximity kernel: count rows of traffic_xyz within sqrt(r2) of (ex, ey, ez) ---
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def count_nearby(traffic_xyz, ex, ey, ez, r2):
+        n = 0
+        for i in range(traffic_xyz.shape[0]):
+            dx = traffic_xyz[i, 0] - ex
+            dy = traffic_xyz[i, 1] - ey
+            dz = traffic_xyz[i, 2] - ez
+            if dx*dx + dy*dy + dz*dz < r2:
+                n += 1
+        return n
+else:
+    def count_nearby(traffic_xyz, ex, ey, ez, r2):
+        diff = traffic_xyz - (ex, ey, ez)
+        return int(np.count_nonzero(np.einsum('ij,ij->i', diff, diff) < r2))
+
+# --- Head pose post-processing: rotation vector -> (pitch_deg, yaw_deg, distracted) ---
+@njit(cache=True)
+def head_pose_angles(rotation_vector, yaw_threshold, pitch_threshold):
+    pitch_deg = rotation_vector[0, 0] * RAD2DEG
+    yaw_deg = rotation_vector[1, 0] * RAD2DEG
+    distracted = abs(yaw_deg) > yaw_threshold or abs(pitch_deg) > pitch_threshold
+    return pitch_deg, yaw_deg, distracted
+
+# --- Driving log columns (rows are plain tuples in this order) ---
+LOG_HEADERS = ('timestamp', 'throttle', 'steer', 'brake', 'speed_kmh',
+               'location_x', 'location_y', 'collision', 'collided_with',
+               'anomaly', 'vehicle_state', 'demo_mode')
 
 # --- MODIFIED: Collision Callback (Smoke logic removed) ---
 def on_collision(event, state_dict, impact_threshold, vehicle_state):
@@ -43,16 +118,21 @@ def on_collision(event, state_dict, impact_threshold, vehicle_state):
     other_actor_type = get_simple_collision_type(event.other_actor.type_id)
     state_dict['collided_with'] = other_actor_type
     
+    if vehicle_state['state'] != "NORMAL":
+        return
+
+    # Compare squared magnitudes; only take the sqrt for the printout
     impulse = event.normal_impulse
-    intensity = (impulse.x**2 + impulse.y**2 + impulse.z**2)**0.5
+    intensity_sq = impulse.x*impulse.x + impulse.y*impulse.y + impulse.z*impulse.z
+    intensity = math.sqrt(intensity_sq)
     
-    if vehicle_state['state'] == "NORMAL" and intensity > impact_threshold:
+    if intensity_sq > impact_threshold * impact_threshold:
         print(f"\n--- CRITICAL EVENT: High-G Impact Detected! (Force: {intensity:.2f}) ---")
         print(f"    Collided with: {other_actor_type}")
         vehicle_state['state'] = "EMERGENCY_STOP"
         vehicle_state['event_type'] = "High-G Impact"
         
-    elif vehicle_state['state'] == "NORMAL":
+    else:
         print(f"\n--- Minor Collision Detected (Force: {intensity:.2f}) ---")
 
 # --- AI Traffic Spawner (Unchanged) ---
@@ -80,35 +160,95 @@ def spawn_ai_traffic(client, world, num_vehicles):
     print(f"Successfully spawned {len(traffic_actor_list)} AI vehicles.")
     return traffic_actor_list
 
-# --- Head Pose Analysis Function (Unchanged) ---
-def run_head_pose_analysis(distraction_event_id, stop_event):
-    print("[Head Pose Thread] Starting...")
+# --- dlib 68-point landmarks matching model_points: nose tip, chin, eye corners, mouth corners ---
+POSE_LANDMARK_IDS = (30, 8, 36, 45, 48, 54)
+
+# --- OpenCV DNN (ResNet-10 SSD) face detector ---
+FACE_DNN_PROTOTXT = "models/deploy.prototxt"
+FACE_DNN_MODEL = "models/res10_300x300_ssd_iter_140000.caffemodel"
+FACE_DNN_CONFIDENCE = 0.5
+
+def load_face_dnn():
+    try:
+        net = cv2.dnn.readNetFromCaffe(FACE_DNN_PROTOTXT, FACE_DNN_MODEL)
+    except cv2.error:
+        print("[Head Pose] SSD face model not found, falling back to dlib HOG detector.")
+        return None
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+def detect_face_dnn(net, frame):
+    """Returns the most confident face in frame as a dlib.rectangle, or None."""
+    h, w = frame.shape[:2]
+    blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+    net.setInput(blob)
+    detections = net.forward()[0, 0]
+    best = int(np.argmax(detections[:, 2]))
+    if detections[best, 2] < FACE_DNN_CONFIDENCE:
+        return None
+    x0, y0, x1, y1 = detections[best, 3:7] * (w, h, w, h)
+    return dlib.rectangle(max(0, int(x0)), max(0, int(y0)), min(w - 1, int(x1)), min(h - 1, int(y1)))
+
+# --- Webcam producer: keeps only the newest frame in frame_queue (maxsize=1) ---
+def capture_latest_frames(cap, frame_queue, stop_event):
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            time.sleep(0.1)
+            continue
+        try:
+            frame_queue.get_nowait() # Drop the stale frame the processor hasn't taken yet
+        except queue.Empty:
+            pass
+        frame_queue.put(frame) # Sole producer, so the queue has room here
+
+# --- Head Pose Analysis Function ---
+def run_head_pose_analysis(distraction_flag, stop_event):
+    print("[Head Pose] Starting...")
     
     YAW_THRESHOLD = 25
     PITCH_THRESHOLD = 20
     COOLDOWN_SECONDS = 3.0
+    DETECTION_SCALE = 0.5 # 640x480 -> 320x240 for the HOG detector
+    DETECTION_INTERVAL = 5
     last_beep_time = 0.0
-    last_print_state = ""
+    frame_idx = 0
+    face = None
+    frame_queue = queue.Queue(maxsize=1)
+    capture_stop_event = threading.Event()
+    capture_thread = None
+    last_pose_state = -1
 
     try:
-        print("[Head Pose Thread] Loading dlib models...")
-        detector = dlib.get_frontal_face_detector()
+        print("[Head Pose] Loading dlib models...")
+        face_net = load_face_dnn()
+        detector = dlib.get_frontal_face_detector() if face_net is None else None
         predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
-        print("[Head Pose Thread] Models loaded.")
+        print("[Head Pose] Models loaded.")
+        if not getattr(dlib, 'USE_AVX_INSTRUCTIONS', False):
+            print("[Head Pose] Warning: dlib was built without AVX; HOG/landmarks will be several times slower.")
+            print("[Head Pose] See doc/installation.md for building dlib with USE_AVX_INSTRUCTIONS.")
         
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
-            print("[Head Pose Thread] Error: Could not open webcam.")
+            print("[Head Pose] Error: Could not open webcam.")
             return
-        
+
+        # VGA is plenty for head pose; a 1-frame buffer keeps us on the newest frame
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cap.set(cv2.CAP_PROP_FPS, 30)
+
         model_points = np.array([
             (0.0, 0.0, 0.0), (0.0, -330.0, -65.0), (-225.0, 170.0, -135.0),
             (225.0, 170.0, -135.0), (-150.0, -150.0, -125.0), (150.0, -150.0, -125.0)
-        ], dtype=np.float64)
+        ], dtype=np.float32)
         
         ret, frame = cap.read()
         if not ret:
-            print("[Head Pose Thread] Error: Could not read from webcam.")
+            print("[Head Pose] Error: Could not read from webcam.")
             cap.release()
             return
             
@@ -120,66 +260,87 @@ def run_head_pose_analysis(distraction_event_id, stop_event):
             dtype=np.float64
         )
         dist_coeffs = np.zeros((4,1)) 
+        image_points = np.empty((len(POSE_LANDMARK_IDS), 2), dtype=np.float32) # Refilled in place each frame
+
+        head_pose_angles(np.zeros((3, 1)), YAW_THRESHOLD, PITCH_THRESHOLD) # JIT warm-up
+
+        # Capture runs in its own thread so frames keep arriving while we detect/solve
+        capture_thread = threading.Thread(
+            target=capture_latest_frames, args=(cap, frame_queue, capture_stop_event), daemon=True
+        )
+        capture_thread.start()
 
-        print("[Head Pose Thread] Running... (Press ESC in main window to quit)")
+        print("[Head Pose] Running... (Press ESC in main window to quit)")
         while not stop_event.is_set():
-            current_print_state = ""
-            ret, frame = cap.read()
-            if not ret:
-                time.sleep(0.1)
+            try:
+                frame = frame_queue.get(timeout=0.5)
+            except queue.Empty:
                 continue
 
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = detector(gray)
+            # Re-detect only every DETECTION_INTERVAL frames (or when we lost the face);
+            # in between the previous box is reused and only landmarks are recomputed
+            frame_idx += 1
+            if face is None or frame_idx % DETECTION_INTERVAL == 0:
+                if face_net is not None:
+                    face = detect_face_dnn(face_net, frame)
+                else:
+                    # HOG fallback: detect on a downscaled copy; landmarks still use the full-res image
+                    small_frame = cv2.resize(frame, (0, 0), fx=DETECTION_SCALE, fy=DETECTION_SCALE,
+                                             interpolation=cv2.INTER_AREA)
+                    faces = detector(cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY))
+                    if len(faces) > 0:
+                        small_face = faces[0]
+                        face = dlib.rectangle(
+                            int(small_face.left() / DETECTION_SCALE), int(small_face.top() / DETECTION_SCALE),
+                            int(small_face.right() / DETECTION_SCALE), int(small_face.bottom() / DETECTION_SCALE)
+                        )
+                    else:
+                        face = None
 
-            if len(faces) > 0:
-                face = faces[0]
-                shape = predictor(gray, face)
-                image_points = np.array([
-                    (shape.part(30).x, shape.part(30).y), (shape.part(8).x, shape.part(8).y),
-                    (shape.part(36).x, shape.part(36).y), (shape.part(45).x, shape.part(45).y),
-                    (shape.part(48).x, shape.part(48).y), (shape.part(54).x, shape.part(54).y)
-                ], dtype=np.float64)
+            if face is not None:
+                # dlib reads intensity straight from the colour frame (channel order doesn't
+                # matter for it), and only at the sampled pixels - no full-frame gray pass
+                shape = predictor(frame, face)
+                for i, landmark_id in enumerate(POSE_LANDMARK_IDS):
+                    part = shape.part(landmark_id)
+                    image_points[i, 0] = part.x
+                    image_points[i, 1] = part.y
 
+                # SQPnP is a closed-form global solver, so no iterative LM refinement per frame
                 (success, rotation_vector, translation_vector) = cv2.solvePnP(
-                    model_points, image_points, camera_matrix, dist_coeffs
+                    model_points, image_points, camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_SQPNP
                 )
 
-                pitch_deg = rotation_vector[0].item() * (180.0 / np.pi)
-                yaw_deg = rotation_vector[1].item() * (180.0 / np.pi)
+                pitch_deg, yaw_deg, distracted = head_pose_angles(rotation_vector, YAW_THRESHOLD, PITCH_THRESHOLD)
 
                 current_time = time.time()
-                if (abs(yaw_deg) > YAW_THRESHOLD) or (abs(pitch_deg) > PITCH_THRESHOLD):
-                    current_print_state = "DISTRACTED"
+                if distracted:
+                    pose_state = POSE_DISTRACTED
                     if (current_time - last_beep_time) > COOLDOWN_SECONDS:
-                        print(f"[Head Pose Thread] DISTRACTION! Yaw: {yaw_deg:.1f}, Pitch: {pitch_deg:.1f}")
-                        pygame.event.post(pygame.event.Event(distraction_event_id))
+                        print(f"[Head Pose] DISTRACTION! Yaw: {yaw_deg:.1f}, Pitch: {pitch_deg:.1f}")
+                        distraction_flag.set()
                         last_beep_time = current_time
                 else:
-                    current_print_state = "ATTENTIVE"
+                    pose_state = POSE_ATTENTIVE
             else:
-                current_print_state = "FACE_NOT_DETECTED"
+                pose_state = POSE_NO_FACE
                             
-            if current_print_state != last_print_state:
-                if current_print_state == "ATTENTIVE":
-                    print("[Head Pose Thread] Status: Looking at screen.")
-                elif current_print_state == "DISTRACTED":
-                    print("[Head Pose Thread] Status: Looking away.")
-                elif current_print_state == "FACE_NOT_DETECTED":
-                    print("[Head Pose Thread] Status: Face not detected.")
-                last_print_state = current_print_state
-        
-            time.sleep(0.05) 
+            if pose_state != last_pose_state:
+                print(POSE_STATUS_MESSAGES[pose_state])
+                last_pose_state = pose_state
 
     except FileNotFoundError as e:
-        print(f"[Head Pose Thread] Error: Missing file! {e.filename}")
-        print("[Head Pose Thread] Please download 'shape_predictor_68_face_landmarks.dat' and place it in the script folder.")
+        print(f"[Head Pose] Error: Missing file! {e.filename}")
+        print("[Head Pose] Please download 'shape_predictor_68_face_landmarks.dat' and place it in the script folder.")
     except Exception as e:
-        print(f"[Head Pose Thread] An unexpected error occurred: {e}")
+        print(f"[Head Pose] An unexpected error occurred: {e}")
     finally:
+        capture_stop_event.set()
+        if capture_thread:
+            capture_thread.join(timeout=1.0)
         if 'cap' in locals() and cap.isOpened():
             cap.release()
-        print("[Head Pose Thread] Stopped.")
+        print("[Head Pose] Stopped.")
 
 
 def main():
@@ -188,29 +349,42 @@ def main():
     traffic_actor_list = [] 
     demo_props_list = [] # List for temporary demo actors (person, spawned car)
     
-    driving_log = []
+    driving_log = [] # Rows waiting to be flushed to log_file
     log_filename = "driving_pattern_log.csv"
+    log_file = None
+    log_writer = None
+    log_rows_written = 0
+    LOG_FLUSH_ROWS = 256
     
     camera = None
     collision_sensor = None
     
     collision_state = {'collided_with': None}
+    collision_queue = queue.Queue()
+    original_settings = None
+    FIXED_DELTA_SECONDS = 0.05
     last_traffic_count = 0
     TRAFFIC_DETECTION_RADIUS = 50.0
     
-    pose_thread = None
-    stop_thread_event = threading.Event()
-    DISTRACTION_EVENT = pygame.USEREVENT + 1
+    # Head pose runs in its own process (own GIL); it owns the webcam and only
+    # signals distractions back through distraction_flag. "spawn" starts it fresh instead
+    # of forking this process after pygame/SDL and the CARLA client threads are running
+    pose_ctx = mp.get_context("spawn")
+    pose_process = None
+    stop_pose_event = pose_ctx.Event()
+    distraction_flag = pose_ctx.Event()
     
     last_input_time = time.time()
     DRIVER_INACTIVITY_THRESHOLD_SECONDS = 7.0
     ROLLOVER_THRESHOLD_DEGREES = 90.0
     HIGH_G_IMPACT_THRESHOLD = 6000.0
+    STOPPED_SPEED_SQ = (1.0 / 3.6) ** 2 # 1 km/h, as (m/s)^2
     
     vehicle_state = {'state': "NORMAL", 'event_type': "None"} 
     
     ecall_sent = False
     doors_opened = False
+    hazard_lights_on = False
     person_spawned = False
     pedestrian_actor = None
     sidewalk_waypoint = None
@@ -231,8 +405,22 @@ def main():
         world_map = world.get_map()
         spectator = world.get_spectator() 
         print("Successfully connected to Carla.")
+
+        # --- Synchronous mode: we drive the clock with world.tick() at a fixed step ---
+        original_settings = world.get_settings()
+        settings = world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = FIXED_DELTA_SECONDS
+        world.apply_settings(settings)
+        client.get_trafficmanager().set_synchronous_mode(True)
         
         traffic_actor_list = spawn_ai_traffic(client, world, 50)
+        traffic_ids = [ai_vehicle.id for ai_vehicle in traffic_actor_list]
+        traffic_xyz = np.empty((len(traffic_ids), 3), dtype=np.float64)
+
+        # Warm up the JIT kernels so the first tick doesn't pay the compile cost
+        anomaly_code(0.0, 0.0, 0.0)
+        count_nearby(traffic_xyz[:0], 0.0, 0.0, 0.0, 1.0)
 
         pygame.init() 
         display = pygame.display.set_mode((800, 600))
@@ -287,21 +475,30 @@ def main():
         collision_sensor = world.spawn_actor(collision_bp, carla.Transform(), attach_to=vehicle)
         actor_list.append(collision_sensor)
         
-        # --- MODIFIED: Removed smoke_bp from lambda ---
-        collision_sensor.listen(
-            lambda event: on_collision(event, collision_state, HIGH_G_IMPACT_THRESHOLD, vehicle_state)
-        )
+        # Events are queued here and handled on the main thread after each tick
+        collision_sensor.listen(collision_queue.put)
         
-        pose_thread = threading.Thread(
+        pose_process = pose_ctx.Process(
             target=run_head_pose_analysis, 
-            args=(DISTRACTION_EVENT, stop_thread_event),
+            args=(distraction_flag, stop_pose_event),
             daemon=True 
         )
-        pose_thread.start()
+        pose_process.start()
+
+        # --- Stream the driving log to disk instead of holding it all in RAM ---
+        log_file = open(log_filename, 'w', newline='', encoding='utf-8', buffering=1 << 16)
+        log_writer = csv.writer(log_file)
+        log_writer.writerow(LOG_HEADERS)
 
         # --- Main Simulation Loop ---
         running = True
         control = carla.VehicleControl()
+        prev_control = None # (throttle, steer, brake, reverse) last sent to the server
+        keys_down = set() # Maintained from KEYDOWN/KEYUP events
+        clock = pygame.time.Clock() # Paces ticks to real time
+        last_flip_time = 0.0
+        DISPLAY_FLIP_INTERVAL_SECONDS = 0.1
+        DRIVER_INPUT_KEYS = {pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d, pygame.K_b, pygame.K_o}
         
         print("\n" + "="*30)
         print("  HACKATHON DEMO CONTROLS")
@@ -312,19 +509,43 @@ def main():
         print("="*30 + "\n")
         
         while running:
-            world.wait_for_tick()
+            # Keep sim time in step with wall-clock time; tick() sleeps, leaving the core to
+            # the capture thread and the pose process
+            clock.tick(1 / FIXED_DELTA_SECONDS)
+            world.tick()
+
+            while True:
+                try:
+                    collision_event = collision_queue.get_nowait()
+                except queue.Empty:
+                    break
+                on_collision(collision_event, collision_state, HIGH_G_IMPACT_THRESHOLD, vehicle_state)
             
-            vehicle_transform = vehicle.get_transform()
-            spectator_transform = carla.Transform(
-                vehicle_transform.location + carla.Location(z=3) - vehicle_transform.get_forward_vector() * 8.0,
-                vehicle_transform.rotation
+            # --- One snapshot per tick: our vehicle's transform/velocity come from it too ---
+            snapshot = world.get_snapshot()
+            vehicle_snapshot = snapshot.find(vehicle.id)
+            transform = vehicle_snapshot.get_transform()
+            velocity = vehicle_snapshot.get_velocity()
+
+            # Chase cam 8m behind / 3m above, from the yaw we already have (no carla vector temporaries)
+            yaw_rad = transform.rotation.yaw * DEG2RAD
+            veh_loc = transform.location
+            spectator_location = carla.Location(
+                veh_loc.x - 8.0 * math.cos(yaw_rad),
+                veh_loc.y - 8.0 * math.sin(yaw_rad),
+                veh_loc.z + 3.0
             )
-            spectator.set_transform(spectator_transform)
+            spectator.set_transform(carla.Transform(spectator_location, transform.rotation))
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYUP:
+                    keys_down.discard(event.key)
+                elif event.type == pygame.WINDOWFOCUSLOST:
+                    keys_down.clear() # KEYUPs won't arrive while unfocused
                 elif event.type == pygame.KEYDOWN:
+                    keys_down.add(event.key)
                     if event.key == pygame.K_ESCAPE:
                         running = False
                     
@@ -333,6 +554,7 @@ def main():
                             print("\n--- MANUAL OVERRIDE: eCall system & Demos reset to NORMAL. ---")
                             vehicle_state['state'] = "NORMAL"
                             vehicle.set_light_state(carla.VehicleLightState.NONE)
+                            hazard_lights_on = False
                             ecall_sent = False
                             doors_opened = False
                             person_spawned = False
@@ -358,11 +580,11 @@ def main():
                             print("\n--- DEMO 1 (HIGH-G IMPACT) ACTIVATED ---")
                             demo_mode = "IMPACT_TEST"
                             # Spawn a parked car 70m in front
-                            fwd_vec = vehicle_transform.get_forward_vector()
-                            spawn_loc = vehicle_transform.location + fwd_vec * 70.0
+                            fwd_vec = transform.get_forward_vector()
+                            spawn_loc = transform.location + fwd_vec * 70.0
                             # Spawn it slightly higher to avoid ground clipping
                             spawn_loc.z += 0.5 
-                            spawn_tf = carla.Transform(spawn_loc, vehicle_transform.rotation)
+                            spawn_tf = carla.Transform(spawn_loc, transform.rotation)
                             
                             obstacle_actor = world.try_spawn_actor(obstacle_car_bp, spawn_tf)
                             if obstacle_actor:
@@ -385,18 +607,18 @@ def main():
                             print("\n--- DEMO 3 (MEDICAL EMERGENCY) ACTIVATED ---")
                             print("--- (Simulating 10s of driver inactivity...) ---")
                             demo_mode = "MEDICAL_TEST"
-                        
-                elif event.type == DISTRACTION_EVENT:
-                    print("--- DISTRACTION DETECTED! (Sound played) ---")
-                    if distraction_sound:
-                        distraction_sound.play()
+
+            if distraction_flag.is_set():
+                distraction_flag.clear()
+                print("--- DISTRACTION DETECTED! (Sound played) ---")
+                if distraction_sound:
+                    distraction_sound.play()
 
             # --- Data necessary for logic ---
-            keys = pygame.key.get_pressed()
-            snapshot = world.get_snapshot()
-            transform = vehicle.get_transform()
-            velocity = vehicle.get_velocity()
-            speed_kmh = 3.6 * velocity.length()
+            # Gates compare squared m/s; the one sqrt per tick is for the anomaly check and log
+            vx, vy, vz = velocity.x, velocity.y, velocity.z
+            speed_sq = vx*vx + vy*vy + vz*vz
+            speed_kmh = 3.6 * math.sqrt(speed_sq)
 
             # --- Detection Logic (Phase 1) ---
             if vehicle_state['state'] == "NORMAL": 
@@ -407,7 +629,7 @@ def main():
                     vehicle_state['event_type'] = "Rollover"
                     
                 current_time = time.time()
-                if demo_mode == "MANUAL" and (current_time - last_input_time) > DRIVER_INACTIVITY_THRESHOLD_SECONDS and speed_kmh > 1.0:
+                if demo_mode == "MANUAL" and (current_time - last_input_time) > DRIVER_INACTIVITY_THRESHOLD_SECONDS and speed_sq > STOPPED_SPEED_SQ:
                     print(f"--- CRITICAL EVENT: Medical Emergency Detected! (No input for {DRIVER_INACTIVITY_THRESHOLD_SECONDS}s) ---")
                     vehicle_state['state'] = "EMERGENCY_STOP"
                     vehicle_state['event_type'] = "Medical Emergency"
@@ -420,7 +642,7 @@ def main():
             
             if vehicle_state['state'] == "EMERGENCY_STOP":
                 if not ecall_sent:
-                    location = vehicle.get_location()
+                    location = transform.location
                     event_type = vehicle_state['event_type']
                     
                     print("\n" + "="*40)
@@ -436,9 +658,11 @@ def main():
                 control.steer = 0.0
                 control.reverse = False
                 control.brake = 0.7 
-                vehicle.set_light_state(carla.VehicleLightState.All)
+                if not hazard_lights_on:
+                    vehicle.set_light_state(carla.VehicleLightState.All)
+                    hazard_lights_on = True
                 
-                if speed_kmh < 1.0:
+                if speed_sq < STOPPED_SPEED_SQ:
                     vehicle_state['state'] = "SECURED"
             
             elif vehicle_state['state'] == "SECURED":
@@ -446,7 +670,9 @@ def main():
                 control.steer = 0.0
                 control.reverse = False
                 control.brake = 1.0 
-                vehicle.set_light_state(carla.VehicleLightState.All)
+                if not hazard_lights_on:
+                    vehicle.set_light_state(carla.VehicleLightState.All)
+                    hazard_lights_on = True
                 
                 if not doors_opened:
                     print("--- VEHICLE SECURED: Opening doors. ---")
@@ -459,7 +685,7 @@ def main():
                 
                 if not person_spawned and pedestrian_bp:
                     print("--- (Attempting to spawn pedestrian on sidewalk) ---")
-                    sidewalk_waypoint = world_map.get_waypoint(vehicle.get_location(), 
+                    sidewalk_waypoint = world_map.get_waypoint(transform.location, 
                                                                project_to_road=False, 
                                                                lane_type=carla.LaneType.Sidewalk)
                     if sidewalk_waypoint:
@@ -492,69 +718,102 @@ def main():
                 control.brake = 0.0
             
             elif vehicle_state['state'] == "NORMAL": # and demo_mode == "MANUAL"
-                if keys[pygame.K_w] or keys[pygame.K_s] or keys[pygame.K_a] or keys[pygame.K_d] or keys[pygame.K_b] or keys[pygame.K_o]:
+                if not keys_down.isdisjoint(DRIVER_INPUT_KEYS):
                     last_input_time = time.time()
                 
-                if keys[pygame.K_w]:
+                if pygame.K_w in keys_down:
                     control.throttle = 0.8; control.reverse = False; control.brake = 0.0
-                elif keys[pygame.K_s]:
+                elif pygame.K_s in keys_down:
                     control.throttle = 0.9; control.brake = 0.0; control.reverse = True
-                elif keys[pygame.K_b]:
+                elif pygame.K_b in keys_down:
                      control.throttle = 0.0; control.brake = 1.0; control.reverse = False
                 else:
                     control.throttle = 0.0; control.brake = 0.0; control.reverse = False
                     
-                if keys[pygame.K_a]:
+                if pygame.K_a in keys_down:
                     control.steer = -0.5
-                elif keys[pygame.K_d]:
+                elif pygame.K_d in keys_down:
                     control.steer = 0.5
                 else:
                     control.steer = 0.0
             
-            vehicle.apply_control(control)
+            # --- Only send the control RPC when the command actually changed ---
+            new_control = (control.throttle, control.steer, control.brake, control.reverse)
+            if new_control != prev_control:
+                vehicle.apply_control(control)
+                prev_control = new_control
 
             # --- Data Logging Block ---
             collided_with_type = collision_state['collided_with']
             anomaly_type = detect_anomalies(control, speed_kmh)
             
-            current_traffic_count = 0
             my_location = transform.location
-            for ai_vehicle in traffic_actor_list:
-                if ai_vehicle.is_alive:
-                    distance = my_location.distance(ai_vehicle.get_location())
-                    if distance < TRAFFIC_DETECTION_RADIUS:
-                        current_traffic_count += 1
+            # Read AI positions from this tick's snapshot instead of one RPC per actor
+            dead_traffic_ids = []
+            n_traffic = 0
+            for actor_id in traffic_ids:
+                actor_snapshot = snapshot.find(actor_id)
+                if actor_snapshot is None:
+                    dead_traffic_ids.append(actor_id)
+                    continue
+                loc = actor_snapshot.get_transform().location
+                traffic_xyz[n_traffic, 0] = loc.x
+                traffic_xyz[n_traffic, 1] = loc.y
+                traffic_xyz[n_traffic, 2] = loc.z
+                n_traffic += 1
+            current_traffic_count = count_nearby(
+                traffic_xyz[:n_traffic], my_location.x, my_location.y, my_location.z,
+                TRAFFIC_DETECTION_RADIUS * TRAFFIC_DETECTION_RADIUS
+            )
+
+            # Lazily reap actors that dropped out of the snapshot (no is_alive RPCs)
+            if dead_traffic_ids:
+                traffic_ids = [actor_id for actor_id in traffic_ids if actor_id not in dead_traffic_ids]
+                traffic_actor_list = [v for v in traffic_actor_list if v.id not in dead_traffic_ids]
             
             if current_traffic_count != last_traffic_count:
                 print(f"Traffic Analysis: {current_traffic_count} cars within {TRAFFIC_DETECTION_RADIUS}m")
                 last_traffic_count = current_traffic_count
             
-            data_entry = {
-                'timestamp': snapshot.timestamp.elapsed_seconds,
-                'throttle': control.throttle, 'steer': control.steer, 'brake': control.brake,
-                'speed_kmh': speed_kmh,
-                'location_x': transform.location.x, 'location_y': transform.location.y,
-                'collision': collided_with_type is not None,
-                'collided_with': collided_with_type if collided_with_type else 'None',
-                'anomaly': anomaly_type,
-                'vehicle_state': vehicle_state['state'],
-                'demo_mode': demo_mode 
-            }
-            driving_log.append(data_entry)
+            # Row order must match LOG_HEADERS
+            driving_log.append((
+                snapshot.timestamp.elapsed_seconds,
+                control.throttle, control.steer, control.brake,
+                speed_kmh,
+                transform.location.x, transform.location.y,
+                collided_with_type is not None,
+                collided_with_type if collided_with_type else 'None',
+                anomaly_type,
+                vehicle_state['state'],
+                demo_mode
+            ))
+            if len(driving_log) >= LOG_FLUSH_ROWS:
+                log_writer.writerows(driving_log)
+                log_rows_written += len(driving_log)
+                driving_log.clear()
             
             collision_state['collided_with'] = None
-            pygame.display.flip()
+
+            # Nothing is drawn to the window, so present it at most 10x/s (flip may block on vsync)
+            now = time.monotonic()
+            if now - last_flip_time > DISPLAY_FLIP_INTERVAL_SECONDS:
+                pygame.display.flip()
+                last_flip_time = now
 
     finally:
         # --- Clean Up ---
         print("\nSimulation ended. Cleaning up...")
         
-        if pose_thread:
-            print("Stopping head pose analysis thread...")
-            stop_thread_event.set()
-            pose_thread.join()
+        if pose_process:
+            print("Stopping head pose analysis process...")
+            stop_pose_event.set()
+            pose_process.join(timeout=5.0)
         
         pygame.quit() 
+
+        if original_settings is not None:
+            client.get_trafficmanager().set_synchronous_mode(False)
+            world.apply_settings(original_settings)
         
         if 'vehicle' in locals() and vehicle.is_alive:
             vehicle.set_light_state(carla.VehicleLightState.NONE)
@@ -577,14 +836,13 @@ def main():
         if traffic_actor_list:
             client.apply_batch([carla.command.DestroyActor(actor) for actor in traffic_actor_list])
         
-        if driving_log:
-            print(f"Writing {len(driving_log)} driving pattern entries to {log_filename}...")
-            headers = driving_log[0].keys() 
-            with open(log_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
-                writer.writerows(driving_log)
-            print(f"Successfully saved log to {log_filename}")
+        if log_file:
+            if driving_log:
+                log_writer.writerows(driving_log)
+                log_rows_written += len(driving_log)
+                driving_log.clear()
+            log_file.close()
+            print(f"Successfully saved {log_rows_written} driving pattern entries to {log_filename}")
         
         print("Cleanup. This is the final version of the script based on our plan.")
 
@@ -9,23 +9,41 @@ Offline system that combines:
 """
 
 import cv2, dlib, os, time, threading, queue, pyttsx3, speech_recognition as sr
-from imutils import face_utils
 from deepface import DeepFace
-from scipy.spatial import distance
 import requests
-from bs4 import BeautifulSoup
-import datetime, requests, random, platform
+from requests.adapters import HTTPAdapter
+from selectolax.parser import HTMLParser
+import datetime, requests, random, platform, re
 import numpy as np
 import mediapipe as mp
+import math
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # ===================== CONFIG =====================
 DLIB_MODEL = "backend/models/shape_predictor_68_face_landmarks.dat"
+EMOTION_ONNX = "backend/models/emotion_int8.onnx"  # Built by export_emotion_onnx.py
 EAR_THRESH, MAR_THRESH = 0.22, 0.65
 FATIGUE_BLINK_LIMIT = 40
 EMOTION_INTERVAL = 30
+SHOW_BG_BLUR = False  # Blur the background behind the driver in the preview window
+SEG_INTERVAL = 4  # Run selfie segmentation every Nth frame
 VOICE_RATE = 170
 WATCHDOG_TIMEOUT = 10
+ASSISTANT_POLL = 5  # seconds the assistant sleeps without a state change (its old fixed cadence)
+DETECT_SIZE = (320, 240)  # dlib detector input; frames are 640x480
+DETECT_UPSCALE = 640 / DETECT_SIZE[0]
 CITY = "Delhi"  # Change for weather
+WEATHER_TTL = 300  # seconds a fetched weather report is reused
 OPENWEATHER_KEY = "YOUR_OPENWEATHERMAP_API_KEY"  # optional
 
 # ===================== MODEL CHECK =====================
@@ -35,6 +53,20 @@ if not os.path.exists(DLIB_MODEL):
         "and place it in backend/models/"
     )
 
+if not getattr(dlib, "USE_AVX_INSTRUCTIONS", False):
+    print("Warning: dlib was built without AVX – face detection/landmarks will be slow. "
+          "See doc/installation.md to rebuild it.")
+
+# ===================== EMOTION MODEL =====================
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+emotion_session = None
+if ort is not None and os.path.exists(EMOTION_ONNX):
+    emotion_session = ort.InferenceSession(EMOTION_ONNX, providers=["CPUExecutionProvider"])
+    emotion_input = emotion_session.get_inputs()[0].name
+else:
+    print(f"Note: {EMOTION_ONNX} or onnxruntime not found – using DeepFace for emotion (slower). "
+          "Run export_emotion_onnx.py to build the INT8 model.")
+
 # ===================== TTS ENGINE SETUP =====================
 system = platform.system().lower()
 if "windows" in system:
@@ -74,40 +106,31 @@ def speak_worker():
         time.sleep(0.2)
 
 
+weather_cache = (0.0, "")  # (fetch time, report)
+
 def get_weather_data():
+    global weather_cache
+    fetched_at, report = weather_cache
+    if report and time.time() - fetched_at < WEATHER_TTL:
+        return report
 
     URL = "https://www.timeanddate.com/weather/india/delhi"
 
     response = requests.get(URL)
     # print(f"res: {response.content}")  # Print first 100 characters of the response content
-    soup = BeautifulSoup(response.content, 'html.parser')
+    tree = HTMLParser(response.content)
 
     # Find temperature and weather description
-    temperature = soup.find("div", class_="h2").text.strip()
-    desc = soup.find("p").text.strip()
-    return f"The current temperature in Delhi is {temperature} with {desc}."
+    temperature = tree.css_first("div.h2").text(strip=True)
+    desc = tree.css_first("p").text(strip=True)
+    report = f"The current temperature in Delhi is {temperature} with {desc}."
+    weather_cache = (time.time(), report)
+    return report
 
 
 def speak(command):
-    """Convert text to speech with threading"""
-    def _speak():
-        try:
-            # Create a new engine instance for thread safety
-            local_engine = pyttsx3.init()
-            local_engine.setProperty('rate', 150)
-            local_engine.setProperty('volume', 0.9)
-            
-            local_engine.say(command)
-            local_engine.runAndWait()
-            local_engine.stop()
-            
-        except Exception as e:
-            pass
-    
-    thread = threading.Thread(target=_speak)
-    thread.daemon = True
-    thread.start()
-    thread.join(timeout=10)
+    """Queue text for the persistent speech worker."""
+    speech_queue.put(command)
 
 
 # ===================== AUDIO INPUT =====================
@@ -125,18 +148,53 @@ def listen():
         return ""
 
 # ===================== HELPER FUNCTIONS =====================
-def ear(eye):
-    A = distance.euclidean(eye[1], eye[5])
-    B = distance.euclidean(eye[2], eye[4])
-    C = distance.euclidean(eye[0], eye[3])
-    return (A + B) / (2.0 * C + 1e-8)
+# dlib 68-point landmark ranges
+EYE_L_IDX, EYE_R_IDX, MOUTH_IDX = slice(36, 42), slice(42, 48), slice(48, 68)
+# Landmark index pairs, relative to the eye (6 pts) / mouth (20 pts) slices
+EAR_A_IDX, EAR_B_IDX = np.array([1, 2, 0]), np.array([5, 4, 3])
+MAR_A_IDX, MAR_B_IDX = np.array([13, 14, 15, 12]), np.array([19, 18, 17, 16])
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _dist(p, i, j):
+        dx = p[i, 0] - p[j, 0]
+        dy = p[i, 1] - p[j, 1]
+        return math.sqrt(dx * dx + dy * dy)
+
+    @njit(cache=True, fastmath=True)
+    def ear(eye):
+        return (_dist(eye, 1, 5) + _dist(eye, 2, 4)) / (2.0 * _dist(eye, 0, 3) + 1e-8)
+
+    @njit(cache=True, fastmath=True)
+    def mar(mouth):
+        return (_dist(mouth, 13, 19) + _dist(mouth, 14, 18) + _dist(mouth, 15, 17)) / (3.0 * (_dist(mouth, 12, 16) + 1e-8))
+
+    # Compile now so analyze() never pays the JIT cost mid-stream
+    ear(np.zeros((6, 2), dtype=np.int32))
+    mar(np.zeros((20, 2), dtype=np.int32))
+else:
+    def ear(eye):
+        diffs = eye[EAR_A_IDX] - eye[EAR_B_IDX]
+        d = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        return (d[0] + d[1]) / (2.0 * d[2] + 1e-8)
+
+    def mar(mouth):
+        diffs = mouth[MAR_A_IDX] - mouth[MAR_B_IDX]
+        d = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        return (d[0] + d[1] + d[2]) / (3.0 * (d[3] + 1e-8))
+
 
-def mar(mouth):
-    A = distance.euclidean(mouth[13], mouth[19])
-    B = distance.euclidean(mouth[14], mouth[18])
-    C = distance.euclidean(mouth[15], mouth[17])
-    D = distance.euclidean(mouth[12], mouth[16]) + 1e-8
-    return (A + B + C) / (3.0 * D)
+def shape_to_coords(shape, out):
+    """Copy dlib's 68 landmarks into a preallocated (68, 2) int32 array."""
+    for i, p in enumerate(shape.parts()):
+        out[i, 0] = p.x
+        out[i, 1] = p.y
+    return out
+
+
+def scale_rect(rect, factor):
+    return dlib.rectangle(int(rect.left() * factor), int(rect.top() * factor),
+                          int(rect.right() * factor), int(rect.bottom() * factor))
 
 
 # ===================== GLOBAL STATE =====================
@@ -149,15 +207,88 @@ last_emotion, last_analysis_time = "unknown", time.time()
 cooldowns = {"drowsy": 0, "alert": 0, "emotion": {}}
 module_alive = True
 WS_INTERVAL = 5  # seconds
+UPDATE_URL = "http://localhost:8008/update-emotion"
+http_session = requests.Session()  # Keep-alive connection to the backend
+http_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+state_q = queue.Queue(maxsize=1)  # Latest unsent driver state only
+emotion_q = queue.Queue(maxsize=1)  # Face crop waiting for the emotion model, if any
+emotion_lock = threading.Lock()
+state_cv = threading.Condition()  # Signals the assistant when driver_state changes
+state_dirty = False
 
 mp_selfie = mp.solutions.selfie_segmentation
-segmentor = mp_selfie.SelfieSegmentation(model_selection=1)
+segmentor = mp_selfie.SelfieSegmentation(model_selection=1) if SHOW_BG_BLUR else None
+SEG_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+seg_mask = seg_mask_inv = None  # Cached blend weights, refreshed every SEG_INTERVAL frames
+
+# ===================== STATE UPDATES =====================
+def set_driver_state(**changes):
+    """Update driver_state and wake the assistant, but only if a value actually changed."""
+    global state_dirty
+    with state_cv:
+        if any(driver_state[k] != v for k, v in changes.items()):
+            driver_state.update(changes)
+            state_dirty = True
+            state_cv.notify()
+
+# ===================== STATE POSTER =====================
+def publish_state(state):
+    """Hand the state to the poster thread, replacing any update it hasn't sent yet."""
+    try:
+        state_q.put_nowait(state)
+    except queue.Full:
+        try:
+            state_q.get_nowait()
+        except queue.Empty:
+            pass
+        state_q.put_nowait(state)
+
+
+def state_poster():
+    """POSTs driver state updates off the capture loop."""
+    while True:
+        state = state_q.get()
+        try:
+            http_session.post(UPDATE_URL, json=state, timeout=0.3)
+        except requests.RequestException:
+            pass
+
+# ===================== EMOTION WORKER =====================
+def classify_emotion(face):
+    """Dominant emotion of a BGR face crop (INT8 ONNX model if built, else DeepFace)."""
+    if emotion_session is not None:
+        face_gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        x = cv2.resize(face_gray, (48, 48), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+        probs = emotion_session.run(None, {emotion_input: x.reshape(1, 48, 48, 1)})[0]
+        return EMOTION_LABELS[int(np.argmax(probs))]
+    # The crop is already the dlib face box, so don't let DeepFace search for a face again
+    res = DeepFace.analyze(face, actions=['emotion'], enforce_detection=False, detector_backend='skip')
+    return res[0]["dominant_emotion"] if isinstance(res, list) else res["dominant_emotion"]
+
+
+def emotion_worker():
+    """Runs the emotion model off the capture loop so a forward pass never stalls the camera."""
+    global last_emotion
+    last_error = None
+    while True:
+        face = emotion_q.get()
+        try:
+            emotion = classify_emotion(face)
+        except Exception as e:
+            if repr(e) != last_error:  # Print each distinct failure once, not every frame
+                print("Emotion inference failed:", e)
+                last_error = repr(e)
+            continue
+        last_error = None
+        with emotion_lock:
+            last_emotion = emotion
 
 # ===================== DRIVER ANALYSIS =====================
 def analyze():
     global blink_count, consec_blink, prev_ear, frame_idx
-    global last_emotion, last_analysis_time, module_alive
+    global last_analysis_time, module_alive
     global last_sent_state, last_ws_time
+    global seg_mask, seg_mask_inv
     
     # Initialize WebSocket tracking variables
     last_sent_state = {"state": "", "emotion": ""}
@@ -173,55 +304,105 @@ def analyze():
         cap = cv2.VideoCapture(1)
         if not cap.isOpened():
             raise RuntimeError("No webcam found. Please check camera connection.")
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep at most one stale frame in the driver
     
     print("Camera initialized successfully")
     speak("Webcam driver monitoring started.")
+
+    # Per-frame working buffers, allocated once so the loop doesn't churn memory
+    frame_buf = np.empty((480, 640, 3), dtype=np.uint8)
+    gray = np.empty((480, 640), dtype=np.uint8)
+    small_gray = np.empty(DETECT_SIZE[::-1], dtype=np.uint8)
+    coords = np.empty((68, 2), dtype=np.int32)  # Reused landmark buffer
+    if SHOW_BG_BLUR:
+        rgb_buf = np.empty((480, 640, 3), dtype=np.uint8)  # Reused RGB copy for MediaPipe
+        mask_u8 = np.empty((480, 640), dtype=np.uint8)
+        small_bg = np.empty((120, 160, 3), dtype=np.uint8)
+        blurred_buf = np.empty((480, 640, 3), dtype=np.uint8)
+        blend_buf = np.empty((480, 640, 3), dtype=np.uint8)
     
+    FRAME_PERIOD = 1 / 30
+    last_retrieve = time.time()
     while True:
-        ok, frame = cap.read()
+        # After a slow iteration the buffered frame is old: grab past it without decoding.
+        # Timed from the last retrieve so the wait inside grab() isn't counted as slowness
+        if time.time() - last_retrieve > FRAME_PERIOD:
+            cap.grab()
+        ok = cap.grab()
+        if ok:
+            ok, frame = cap.retrieve()
+        last_retrieve = time.time()
         if not ok:
             time.sleep(0.05)
             continue
 
-        frame = cv2.resize(frame, (640, 480))
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame = cv2.resize(frame, (640, 480), dst=frame_buf)
 
         # ============ PERSON SEGMENTATION ============
-        try:
-            result = segmentor.process(rgb)  # Get mask for body
-            mask = result.segmentation_mask
-            
-            # Improve mask processing
-            mask = (mask > 0.3).astype(np.uint8)
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-            mask = cv2.GaussianBlur(mask.astype(np.float32), (3, 3), 0)
+        # Purely cosmetic (display only) - off by default to keep the budget for monitoring
+        if SHOW_BG_BLUR:
+            try:
+                # The CNN only runs every SEG_INTERVAL frames; the cached mask is reused in between
+                if seg_mask is None or frame_idx % SEG_INTERVAL == 0:
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+                    result = segmentor.process(rgb_buf)  # Get mask for body
+                
+                    # Improve mask processing, all at uint8 (0.3 confidence ~= 76/255)
+                    cv2.convertScaleAbs(result.segmentation_mask, dst=mask_u8, alpha=255)
+                    cv2.threshold(mask_u8, 76, 255, cv2.THRESH_BINARY, dst=mask_u8)
+                    cv2.morphologyEx(mask_u8, cv2.MORPH_CLOSE, SEG_KERNEL, dst=mask_u8)
+                    cv2.GaussianBlur(mask_u8, (3, 3), 0, dst=mask_u8)
+                    # blendLinear normalises by w1 + w2, so 0..255 weights need no rescale
+                    if seg_mask is None:
+                        seg_mask = np.empty((480, 640), dtype=np.float32)
+                        seg_mask_inv = np.empty_like(seg_mask)
+                    np.copyto(seg_mask, mask_u8)
+                    np.subtract(255.0, seg_mask, out=seg_mask_inv)
             
-            # Create blurred background
-            blurred_frame = cv2.GaussianBlur(frame, (55, 55), 0)
+                # Create blurred background: blur a quarter-size copy and scale back up,
+                # which looks the same as a 55x55 kernel at full res for ~1/16 of the work
+                cv2.resize(frame, (160, 120), dst=small_bg, interpolation=cv2.INTER_AREA)
+                cv2.GaussianBlur(small_bg, (15, 15), 0, dst=small_bg)
+                cv2.resize(small_bg, (640, 480), dst=blurred_buf, interpolation=cv2.INTER_LINEAR)
             
-            # Combine with smooth blending
-            mask_3d = np.stack([mask] * 3, axis=2)
-            frame = (frame * mask_3d + blurred_frame * (1 - mask_3d)).astype(np.uint8)
-        except Exception as e:
-            print(f"MediaPipe error: {e}")
-            # Continue without background blur if MediaPipe fails
+                # Combine with smooth blending (single SIMD pass, no 3-channel float temporaries)
+                frame = cv2.blendLinear(frame, blurred_buf, seg_mask, seg_mask_inv, dst=blend_buf)
+            except Exception as e:
+                print(f"MediaPipe error: {e}")
+                # Continue without background blur if MediaPipe fails
 
         # ================= FACE + MONITOR LOGIC =================
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rects = detector(gray, 0)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        # HOG on a downscaled copy, boxes mapped back so landmarks use full resolution
+        cv2.resize(gray, DETECT_SIZE, dst=small_gray, interpolation=cv2.INTER_AREA)
+        rects = [scale_rect(r, DETECT_UPSCALE) for r in detector(small_gray, 0)]
         frame_idx += 1
 
         if len(rects) == 0:
-            driver_state.update({"state": "unknown", "emotion": "unknown"})
+            set_driver_state(state="unknown", emotion="unknown")
             cv2.putText(frame, "No face detected", (10, 110),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         else:
-            drowsy, emotion = "Unknown", last_emotion
+            with emotion_lock:
+                drowsy, emotion = "Unknown", last_emotion
+
+            # Emotion is gated once per frame (not per face) and only looks at the driver,
+            # taken to be the largest face in view (before any overlay is drawn)
+            if frame_idx % (EMOTION_INTERVAL * 5) == 0:
+                # Only the dlib face box goes to the model, not the whole frame.
+                # Skip this tick if the worker is still busy with the previous face.
+                driver_rect = max(rects, key=lambda r: r.area())
+                face = frame[max(0, driver_rect.top()):driver_rect.bottom(),
+                             max(0, driver_rect.left()):driver_rect.right()]
+                if face.size:
+                    try:
+                        emotion_q.put_nowait(face.copy())
+                    except queue.Full:
+                        pass
+
             for rect in rects:
-                shape = predictor(gray, rect)
-                shape = face_utils.shape_to_np(shape)
-                lEye, rEye, mouth = shape[36:42], shape[42:48], shape[48:68]
+                shape = shape_to_coords(predictor(gray, rect), coords)
+                lEye, rEye, mouth = shape[EYE_L_IDX], shape[EYE_R_IDX], shape[MOUTH_IDX]
                 ear_avg = (ear(lEye) + ear(rEye)) / 2.0
                 mar_val = mar(mouth)
 
@@ -237,28 +418,16 @@ def analyze():
                 yawn = mar_val > MAR_THRESH
                 drowsy = "Drowsy" if ear_avg < EAR_THRESH or yawn or blink_count > FATIGUE_BLINK_LIMIT else "Alert"
 
-                if frame_idx % (EMOTION_INTERVAL * 5) == 0:
-                    try:
-                        res = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
-                        emotion = res[0]["dominant_emotion"] if isinstance(res, list) else res["dominant_emotion"]
-                    except:
-                        pass
-                    last_emotion = emotion
-
-                driver_state.update({"state": drowsy.lower(), "emotion": emotion.lower()})
+                set_driver_state(state=drowsy.lower(), emotion=emotion.lower())
                 # Optimized WebSocket - only send on state change or time interval
                 current_time = time.time()
                 state_changed = (driver_state["state"] != last_sent_state["state"] or 
                                driver_state["emotion"] != last_sent_state["emotion"])
                 
                 if state_changed or (current_time - last_ws_time > WS_INTERVAL):
-                    try:
-                        requests.post("http://localhost:8008/update-emotion", 
-                                    json=driver_state, timeout=0.3)
-                        last_sent_state = driver_state.copy()
-                        last_ws_time = current_time
-                    except:
-                        pass
+                    last_sent_state = driver_state.copy()
+                    publish_state(last_sent_state)
+                    last_ws_time = current_time
 
                 last_analysis_time = time.time()
                 cv2.putText(frame, f"EAR:{ear_avg:.2f} MAR:{mar_val:.2f}", (10, 80),
@@ -292,7 +461,7 @@ def get_dynamic_response(key: str):
 
 # ===================== VOICE ASSISTANT (Context-Aware) =====================
 def assistant():
-    global module_alive
+    global module_alive, state_dirty
     while True:
         now = time.time()
         elapsed = now - last_analysis_time
@@ -323,44 +492,52 @@ def assistant():
                 speak(get_dynamic_response(emotion))
             cooldowns["emotion"][emotion] = now
 
-        time.sleep(5)
+        # Sleep until analyze() reports a change; the timeout keeps the watchdog and cooldowns ticking
+        with state_cv:
+            state_cv.wait_for(lambda: state_dirty, timeout=ASSISTANT_POLL)
+            state_dirty = False
 
 # ===================== COMMAND PROCESSOR =====================
+# Every intent in one pattern; a single scan of the utterance finds them all
+CMD_RE = re.compile(
+    r"\b(?:(?P<time>time)|(?P<date>date|day)|(?P<weather>weather)"
+    r"|i(?:'m| am) (?:(?P<tired>tired)|(?P<angry>angry)|(?P<sad>sad)|(?P<happy>happy))"
+    r"|(?P<status>status|driver|how am i)|(?P<exit>exit|quit|stop))\b"
+)
+
 def process_command(cmd):
-    cmd = cmd.lower()
+    intents = {m.lastgroup for m in CMD_RE.finditer(cmd.lower())}
 
     # Conversational context understanding
-    if "time" in cmd:
+    if "time" in intents:
         now = datetime.datetime.now().strftime("%I:%M %p")
         speak(f"The current time is {now}.")
-    if "date" in cmd or "day" in cmd:
+    if "date" in intents:
         today = datetime.datetime.now().strftime("%A, %B %d, %Y")
         speak(f"Today is {today}.")
-    if "weather" in cmd:
+    if "weather" in intents:
         speak("Checking the weather.")
         speak(get_weather_data())
-    if "i'm tired" in cmd or "i am tired" in cmd:
+    if "tired" in intents:
         speak("You seem exhausted. Pull over and take a short break.")
-        driver_state["state"] = "drowsy"
-    if "i'm angry" in cmd or "i am angry" in cmd:
+        set_driver_state(state="drowsy")
+    if "angry" in intents:
         speak("It’s okay to feel angry. Let’s take a deep breath together.")
-        driver_state["emotion"] = "angry"
-    if "i'm sad" in cmd or "i am sad" in cmd:
+        set_driver_state(emotion="angry")
+    if "sad" in intents:
         speak("I’m here with you. Things will get better. Stay strong.")
-        driver_state["emotion"] = "sad"
-    if "i'm happy" in cmd or "i am happy" in cmd:
+        set_driver_state(emotion="sad")
+    if "happy" in intents:
         speak("That’s great to hear! Keep that positive energy.")
-        driver_state["emotion"] = "happy"
+        set_driver_state(emotion="happy")
 
-    if "status" in cmd or "driver" in cmd or "how am i" in cmd:
+    if "status" in intents:
         s, e = driver_state["state"], driver_state["emotion"]
         speak(f"You are {s} and seem {e}.")
-    if "exit" in cmd or "quit" in cmd or "stop" in cmd:
+    if "exit" in intents:
         speak("Shutting down Vigilance AI. Drive safe.")
         speech_queue.put("EXIT")
         return False
-    else:
-        pass
     return True
 
 def commands():
@@ -373,10 +550,15 @@ def commands():
 
 # ===================== MAIN =====================
 def main():
+    voice_thread = threading.Thread(target=speak_worker, daemon=True)
+    voice_thread.start()
     speak("Vigilance AI context-aware assistant activated.")
+    threading.Thread(target=state_poster, daemon=True).start()
+    threading.Thread(target=emotion_worker, daemon=True).start()
     threading.Thread(target=analyze, daemon=True).start()
     threading.Thread(target=assistant, daemon=True).start()
     commands()
+    voice_thread.join(timeout=10)  # Let the goodbye message finish before exiting
 
 if __name__ == "__main__":
     try:
@@ -81,6 +81,7 @@ def main():
         # --- 8. The Main Simulation Loop ---
         running = True
         control = carla.VehicleControl()
+        keys_down = set() # Maintained from KEYDOWN/KEYUP events
         
         print("\n--- Starting Manual Control ---")
         print("  Drive the car using WASD. Try to crash into something.")
@@ -101,17 +102,21 @@ def main():
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYUP:
+                    keys_down.discard(event.key)
+                elif event.type == pygame.WINDOWFOCUSLOST:
+                    keys_down.clear() # KEYUPs won't arrive while unfocused
                 elif event.type == pygame.KEYDOWN:
+                    keys_down.add(event.key)
                     if event.key == pygame.K_ESCAPE:
                         running = False
 
             # --- Control logic ---
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_w]:
+            if pygame.K_w in keys_down:
                 control.throttle = 0.8 
                 control.reverse = False
                 control.brake = 0.0
-            elif keys[pygame.K_s]:
+            elif pygame.K_s in keys_down:
                 control.throttle = 0.5
                 control.brake = 0.0
                 control.reverse = True
@@ -119,9 +124,9 @@ def main():
                 control.throttle = 0.0
                 control.brake = 0.0
 
-            if keys[pygame.K_a]:
+            if pygame.K_a in keys_down:
                 control.steer = -0.5
-            elif keys[pygame.K_d]:
+            elif pygame.K_d in keys_down:
                 control.steer = 0.5
             else:
                 control.steer = 0.0
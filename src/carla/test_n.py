@@ -8,16 +8,41 @@ Performs:
  • ACTIVE / OFFLINE overlay + watchdog
 """
 
-import cv2, dlib, os, time, threading, pyttsx3, speech_recognition as sr
+import cv2, dlib, os, time, threading, queue, pyttsx3, speech_recognition as sr
 from imutils import face_utils
 from deepface import DeepFace
-from scipy.spatial import distance
+import numpy as np
+import math
+from collections import deque
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import json, vosk, sounddevice as sd
+except ImportError:
+    vosk = None
 
 # ===================== CONFIG =====================
 DLIB_MODEL = "backend/models/shape_predictor_68_face_landmarks.dat"
+EMOTION_ONNX = "backend/models/emotion_int8.onnx"  # Built by export_emotion_onnx.py
+VOSK_MODEL = "backend/models/vosk-model-small-en-us-0.15"  # Offline speech recognition
+VOSK_RATE = 16000
+LISTEN_SECONDS = 8  # Same budget as the old 4 s wait + 4 s phrase limit
 EAR_THRESH, MAR_THRESH = 0.22, 0.65
 FATIGUE_BLINK_LIMIT = 40
 EMOTION_INTERVAL = 30
+DETECT_WIDTH = 320  # dlib detector input width; landmarks still use the full frame
+DETECT_INTERVAL = 5  # Re-run the face detector every Nth frame, reuse its boxes in between
+EMOTION_BATCH = 8  # face crops from the frames leading up to each emotion tick
 VOICE_RATE = 170
 WATCHDOG_TIMEOUT = 10
 
@@ -35,6 +60,26 @@ engine = pyttsx3.init(driverName='sapi5')  # use 'espeak' on Linux
 engine.setProperty("rate", VOICE_RATE)
 recognizer = sr.Recognizer()
 
+vosk_model = None
+if vosk is not None and os.path.isdir(VOSK_MODEL):
+    vosk.SetLogLevel(-1)
+    vosk_model = vosk.Model(VOSK_MODEL)
+else:
+    print(f"Note: {VOSK_MODEL} or vosk not found – using Google speech recognition (online, slower).")
+
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+emotion_session = None
+if ort is not None and os.path.exists(EMOTION_ONNX):
+    providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider")
+                 if p in ort.get_available_providers()]
+    emotion_session = ort.InferenceSession(EMOTION_ONNX, providers=providers)
+    emotion_input = emotion_session.get_inputs()[0].name
+    # Warm-up run so the first real frame doesn't pay for graph/kernel setup
+    emotion_session.run(None, {emotion_input: np.zeros((1, 48, 48, 1), dtype=np.float32)})
+else:
+    print(f"Note: {EMOTION_ONNX} or onnxruntime not found – using DeepFace for emotion (slower). "
+          "Run export_emotion_onnx.py to build the model.")
+
 def speak(txt):
     print("Assistant:", txt)
     try:
@@ -43,8 +88,22 @@ def speak(txt):
     except Exception as e:
         print("Voice error:", e)
 
+def listen_offline():
+    """Recognize one utterance locally with Vosk."""
+    rec = vosk.KaldiRecognizer(vosk_model, VOSK_RATE)
+    with sd.RawInputStream(samplerate=VOSK_RATE, blocksize=4000, dtype='int16', channels=1) as stream:
+        print("Listening...")
+        deadline = time.time() + LISTEN_SECONDS
+        while time.time() < deadline:
+            data, _ = stream.read(4000)
+            if rec.AcceptWaveform(bytes(data)):
+                return json.loads(rec.Result()).get("text", "")
+    return json.loads(rec.FinalResult()).get("text", "")
+
 def listen():
     try:
+        if vosk_model is not None:
+            return listen_offline().lower()
         with sr.Microphone() as src:
             print("Listening...")
             recognizer.adjust_for_ambient_noise(src, duration=0.5)
@@ -53,43 +112,131 @@ def listen():
     except:
         return ""
 
-def ear(eye):
-    A = distance.euclidean(eye[1], eye[5])
-    B = distance.euclidean(eye[2], eye[4])
-    C = distance.euclidean(eye[0], eye[3])
-    return (A + B) / (2.0 * C + 1e-8)
+# Landmark index pairs, relative to the eye (6 pts) / mouth (20 pts) slices
+EAR_A_IDX, EAR_B_IDX = np.array([1, 2, 0]), np.array([5, 4, 3])
+MAR_A_IDX, MAR_B_IDX = np.array([13, 14, 15, 12]), np.array([19, 18, 17, 16])
+
+def face_tensor(face_gray):
+    """Grayscale face crop -> normalized 48x48 model input."""
+    return cv2.resize(face_gray, (48, 48), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+def classify_faces(faces):
+    """Dominant emotion over a batch of face tensors, in one ONNX call."""
+    probs = emotion_session.run(None, {emotion_input: np.stack(faces)[..., None]})[0]
+    return EMOTION_LABELS[int(np.argmax(probs.mean(axis=0)))]
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _dist(p, i, j):
+        dx = p[i, 0] - p[j, 0]
+        dy = p[i, 1] - p[j, 1]
+        return math.sqrt(dx * dx + dy * dy)
+
+    @njit(cache=True, fastmath=True)
+    def ear(eye):
+        return (_dist(eye, 1, 5) + _dist(eye, 2, 4)) / (2.0 * _dist(eye, 0, 3) + 1e-8)
+
+    @njit(cache=True, fastmath=True)
+    def mar(mouth):
+        return (_dist(mouth, 13, 19) + _dist(mouth, 14, 18) + _dist(mouth, 15, 17)) / (3.0 * (_dist(mouth, 12, 16) + 1e-8))
+
+    # Compile now for the landmark dtype shape_to_np produces, so analyze() never pays the JIT cost
+    _landmark_dtype = np.zeros(1, dtype="int").dtype
+    ear(np.zeros((6, 2), dtype=_landmark_dtype))
+    mar(np.zeros((20, 2), dtype=_landmark_dtype))
+else:
+    def ear(eye):
+        d = np.linalg.norm(eye[EAR_A_IDX] - eye[EAR_B_IDX], axis=1)
+        return (d[0] + d[1]) / (2.0 * d[2] + 1e-8)
 
-def mar(mouth):
-    A = distance.euclidean(mouth[13], mouth[19])
-    B = distance.euclidean(mouth[14], mouth[18])
-    C = distance.euclidean(mouth[15], mouth[17])
-    D = distance.euclidean(mouth[12], mouth[16]) + 1e-8
-    return (A + B + C) / (3.0 * D)
+    def mar(mouth):
+        d = np.linalg.norm(mouth[MAR_A_IDX] - mouth[MAR_B_IDX], axis=1)
+        return (d[0] + d[1] + d[2]) / (3.0 * (d[3] + 1e-8))
+
+def scale_rect(rect, factor):
+    return dlib.rectangle(int(rect.left() * factor), int(rect.top() * factor),
+                          int(rect.right() * factor), int(rect.bottom() * factor))
 
 # ===================== GLOBAL STATE =====================
 driver_state = {"state": "unknown", "emotion": "unknown"}
 blink_count = consec_blink = 0
 prev_ear, frame_idx = 1.0, 0
 last_emotion, last_analysis_time = "unknown", time.time()
+face_buffer = deque(maxlen=EMOTION_BATCH)
+emotion_q = queue.Queue(maxsize=1)  # Newest emotion job wins
+emotion_lock = threading.Lock()
 module_alive = True
 
+# ===================== EMOTION WORKER =====================
+def classify_emotion(job):
+    """job is a list of face tensors (ONNX model) or a BGR face crop (DeepFace fallback)."""
+    if emotion_session is not None:
+        return classify_faces(job)
+    # The crop is already the dlib face box, so don't let DeepFace search for a face again
+    res = DeepFace.analyze(job, actions=['emotion'], enforce_detection=False, detector_backend='skip')
+    return res[0]["dominant_emotion"] if isinstance(res, list) else res["dominant_emotion"]
+
+def submit_emotion(job):
+    """Queue a job for the worker, replacing one it hasn't picked up yet."""
+    try:
+        emotion_q.get_nowait()
+    except queue.Empty:
+        pass
+    emotion_q.put_nowait(job)
+
+def emotion_worker():
+    """Runs emotion inference off the capture loop so it never stalls the camera."""
+    global last_emotion
+    last_error = None
+    while True:
+        job = emotion_q.get()
+        try:
+            emotion = classify_emotion(job)
+        except Exception as e:
+            if repr(e) != last_error:  # Print each distinct failure once, not every frame
+                print("Emotion inference failed:", e)
+                last_error = repr(e)
+            continue
+        last_error = None
+        with emotion_lock:
+            last_emotion = emotion
+
 # ===================== ANALYSIS THREAD =====================
 def analyze():
     global blink_count, consec_blink, prev_ear, frame_idx
-    global last_emotion, last_analysis_time, module_alive
+    global last_analysis_time, module_alive
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         raise RuntimeError("Webcam not found.")
+    # 640x480 is plenty for landmarks; a 1-frame buffer means read() returns the newest frame
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    print(f"Camera: {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+          f"@ {cap.get(cv2.CAP_PROP_FPS):.0f} fps")
 
     speak("Webcam driver monitoring started.")
+    rects, frames_since_detect = [], 0
+    gray = None
     while True:
         ok, frame = cap.read()
         if not ok:
             time.sleep(0.05)
             continue
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rects = detector(gray, 0)
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = np.empty(frame.shape[:2], dtype=np.uint8)  # Reused every frame
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        # The driver's head moves little between frames: only search for it every
+        # DETECT_INTERVAL frames (or while no face is found) and reuse the boxes otherwise
+        if not rects or frames_since_detect >= DETECT_INTERVAL:
+            # HOG on a downscaled copy, boxes mapped back so landmarks use full resolution
+            scale = gray.shape[1] / DETECT_WIDTH
+            small_gray = cv2.resize(gray, (DETECT_WIDTH, int(gray.shape[0] / scale)), interpolation=cv2.INTER_AREA)
+            rects = [scale_rect(r, scale) for r in detector(small_gray, 0)]
+            frames_since_detect = 0
+        frames_since_detect += 1
         frame_idx += 1
 
         if len(rects) == 0:
@@ -97,7 +244,29 @@ def analyze():
             cv2.putText(frame, "No face detected", (10, 110),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,255), 2)
         else:
-            drowsy, emotion = "Unknown", last_emotion
+            with emotion_lock:
+                drowsy, emotion = "Unknown", last_emotion
+
+            # Emotion is gated once per frame (not per face) and only looks at the driver,
+            # taken to be the largest face in view (before any overlay is drawn)
+            emotion_period = EMOTION_INTERVAL * 5
+            driver_rect = max(rects, key=lambda r: r.area())
+            face_roi = (slice(max(0, driver_rect.top()), driver_rect.bottom()),
+                        slice(max(0, driver_rect.left()), driver_rect.right()))
+            if emotion_session is not None and -frame_idx % emotion_period < EMOTION_BATCH:
+                # Collect face crops over the last few frames before each emotion tick
+                face = gray[face_roi]
+                if face.size:
+                    face_buffer.append(face_tensor(face))
+
+            if frame_idx % emotion_period == 0:
+                if emotion_session is not None:
+                    if face_buffer:
+                        submit_emotion(list(face_buffer))
+                        face_buffer.clear()
+                elif frame[face_roi].size:
+                    submit_emotion(frame[face_roi].copy())
+
             for rect in rects:
                 shape = predictor(gray, rect)
                 shape = face_utils.shape_to_np(shape)
@@ -117,14 +286,6 @@ def analyze():
                 yawn = mar_val > MAR_THRESH
                 drowsy = "Drowsy" if ear_avg < EAR_THRESH or yawn or blink_count > FATIGUE_BLINK_LIMIT else "Alert"
 
-                if frame_idx % (EMOTION_INTERVAL * 5) == 0:
-                    try:
-                        res = DeepFace.analyze(frame, actions=['emotion'], enforce_detection=False)
-                        emotion = res[0]["dominant_emotion"] if isinstance(res, list) else res["dominant_emotion"]
-                    except:
-                        pass
-                    last_emotion = emotion
-
                 driver_state.update({"state": drowsy.lower(), "emotion": emotion.lower()})
                 last_analysis_time = time.time()
                 cv2.putText(frame, f"EAR:{ear_avg:.2f} MAR:{mar_val:.2f}", (10,80),
@@ -183,6 +344,7 @@ def commands():
 # ===================== MAIN =====================
 def main():
     speak("Vigilance AI webcam mode activated.")
+    threading.Thread(target=emotion_worker, daemon=True).start()
     threading.Thread(target=analyze, daemon=True).start()
     threading.Thread(target=assistant, daemon=True).start()
     commands()
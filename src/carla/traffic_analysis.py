@@ -4,7 +4,10 @@ import random
 import time
 import os
 import pygame
+import numpy as np
 import csv
+import queue
+import threading
 
 # --- Helper function to simplify actor type names (Unchanged) ---
 def get_simple_collision_type(actor_type_id):
@@ -44,6 +47,46 @@ def detect_anomalies(control, speed_kmh):
         return "Excessive_Speeding"
     return "None"
 
+# --- Background CSV logger ---
+# The sim loop only enqueues tuples; this thread does all file I/O in batches
+LOG_HEADERS = ('timestamp', 'throttle', 'steer', 'brake', 'speed_kmh',
+               'location_x', 'location_y', 'collision', 'collided_with', 'anomaly')
+LOG_BATCH_ROWS = 200
+
+def log_writer(log_queue, log_filename):
+    """Streams rows from log_queue to the CSV until it receives None."""
+    with open(log_filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(LOG_HEADERS)
+        done = False
+        while not done:
+            batch = [log_queue.get()] # Block for the first row, then take whatever is queued
+            while len(batch) < LOG_BATCH_ROWS:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None: # Sentinel is always the last row ever queued
+                batch.pop()
+                done = True
+            writer.writerows(batch)
+            csvfile.flush()
+
+# --- Batched cleanup ---
+def destroy_actors(client, actors):
+    """
+    Destroys actors by id in a single synchronous RPC.
+    Returns how many could not be destroyed.
+    """
+    if not actors:
+        return 0
+    try:
+        responses = client.apply_batch_sync([carla.command.DestroyActor(actor.id) for actor in actors])
+    except RuntimeError as e:
+        print(f"Batch destroy failed: {e}")
+        return len(actors)
+    return sum(1 for response in responses if response.error)
+
 # --- NEW: Function to spawn AI Traffic ---
 def spawn_ai_traffic(client, world, num_vehicles):
     """
@@ -90,10 +133,16 @@ def main():
     # --- Configuration ---
     actor_list = [] # List for our car + sensors
     traffic_actor_list = [] # --- NEW: List for all AI cars ---
-    driving_log = []
+    log_rows = 0
+    dropped_log_rows = 0
     log_filename = "driving_pattern_log.csv"
+    log_queue = queue.Queue(maxsize=10000)
+    log_thread = threading.Thread(target=log_writer, args=(log_queue, log_filename), daemon=True)
+    log_thread.start()
     
     camera = None
+    original_settings = None
+    FIXED_DELTA_SECONDS = 0.05
     collision_sensor = None
     
     collision_state = {'collided_with': None}
@@ -101,6 +150,7 @@ def main():
     # --- NEW: State for Traffic Analysis ---
     last_traffic_count = 0
     TRAFFIC_DETECTION_RADIUS = 50.0 # 50 meters
+    TRAFFIC_DETECTION_RADIUS_SQ = TRAFFIC_DETECTION_RADIUS ** 2 # Compare squared distances, no sqrt
     
     try:
         # --- Connect to Carla ---
@@ -109,10 +159,21 @@ def main():
         world = client.get_world()
         spectator = world.get_spectator() 
         print("Successfully connected to Carla.")
+
+        # --- Synchronous mode: we drive the clock with world.tick() at a fixed step ---
+        original_settings = world.get_settings()
+        settings = world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = FIXED_DELTA_SECONDS
+        world.apply_settings(settings)
+        client.get_trafficmanager().set_synchronous_mode(True)
         
         # --- NEW: Spawn the AI traffic ---
         # We pass the client and world, and ask for 50 cars
         traffic_actor_list = spawn_ai_traffic(client, world, 50)
+        # AI positions are read from the per-tick world snapshot by id (no per-actor RPC)
+        traffic_ids = [v.id for v in traffic_actor_list]
+        traffic_positions = np.empty((len(traffic_ids), 3), dtype=np.float32)
 
         # --- Pygame Setup ---
         pygame.init()
@@ -149,6 +210,8 @@ def main():
         # --- Main Simulation Loop ---
         running = True
         control = carla.VehicleControl()
+        keys_down = set() # Maintained from KEYDOWN/KEYUP events
+        clock = pygame.time.Clock() # Paces ticks to real time
         
         print("\n--- Starting Manual Control ---")
         print("  Drive the car using WASD. AI traffic is active.")
@@ -156,7 +219,8 @@ def main():
         print("  ESC or Close Window: Quit")
         
         while running:
-            world.wait_for_tick()
+            clock.tick(1 / FIXED_DELTA_SECONDS) # Sleep so each FIXED_DELTA_SECONDS step takes that long in real time
+            world.tick()
             
             # --- Spectator Camera ---
             vehicle_transform = vehicle.get_transform()
@@ -170,22 +234,25 @@ def main():
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.KEYUP:
+                    keys_down.discard(event.key)
+                elif event.type == pygame.WINDOWFOCUSLOST:
+                    keys_down.clear() # KEYUPs won't arrive while unfocused
                 elif event.type == pygame.KEYDOWN:
+                    keys_down.add(event.key)
                     if event.key == pygame.K_ESCAPE:
                         running = False
 
             # --- Control logic ---
-            keys = pygame.key.get_pressed()
-            # (Control logic is unchanged...)
-            if keys[pygame.K_w]:
+            if pygame.K_w in keys_down:
                 control.throttle = 0.8; control.reverse = False; control.brake = 0.0
-            elif keys[pygame.K_s]:
+            elif pygame.K_s in keys_down:
                 control.throttle = 0.5; control.brake = 0.0; control.reverse = True
             else:
                 control.throttle = 0.0; control.brake = 0.0
-            if keys[pygame.K_a]:
+            if pygame.K_a in keys_down:
                 control.steer = -0.5
-            elif keys[pygame.K_d]:
+            elif pygame.K_d in keys_down:
                 control.steer = 0.5
             else:
                 control.steer = 0.0
@@ -201,14 +268,17 @@ def main():
             anomaly_type = detect_anomalies(control, speed_kmh)
             
             # --- NEW: Traffic Analysis Logic ---
-            current_traffic_count = 0
             my_location = transform.location
-            for ai_vehicle in traffic_actor_list:
-                if ai_vehicle.is_alive: # Check if car hasn't been destroyed
-                    ai_location = ai_vehicle.get_location()
-                    distance = my_location.distance(ai_location)
-                    if distance < TRAFFIC_DETECTION_RADIUS:
-                        current_traffic_count += 1
+            num_alive = 0
+            for ai_id in traffic_ids:
+                ai_snapshot = snapshot.find(ai_id)
+                if ai_snapshot is not None: # None once the car has been destroyed
+                    ai_location = ai_snapshot.get_transform().location
+                    traffic_positions[num_alive] = (ai_location.x, ai_location.y, ai_location.z)
+                    num_alive += 1
+            offsets = traffic_positions[:num_alive] - np.array([my_location.x, my_location.y, my_location.z], dtype=np.float32)
+            dist_sq = np.einsum('ij,ij->i', offsets, offsets)
+            current_traffic_count = int(np.count_nonzero(dist_sq < TRAFFIC_DETECTION_RADIUS_SQ))
             
             # --- NEW: Intelligent Printing ---
             if current_traffic_count != last_traffic_count:
@@ -216,16 +286,19 @@ def main():
                 last_traffic_count = current_traffic_count
             
             # --- Data Logging (Unchanged, but logging continues) ---
-            data_entry = {
-                'timestamp': snapshot.timestamp.elapsed_seconds,
-                'throttle': control.throttle, 'steer': control.steer, 'brake': control.brake,
-                'speed_kmh': speed_kmh,
-                'location_x': transform.location.x, 'location_y': transform.location.y,
-                'collision': collided_with_type is not None,
-                'collided_with': collided_with_type if collided_with_type else 'None',
-                'anomaly': anomaly_type
-            }
-            driving_log.append(data_entry)
+            try:
+                log_queue.put_nowait((
+                    snapshot.timestamp.elapsed_seconds,
+                    control.throttle, control.steer, control.brake,
+                    speed_kmh,
+                    transform.location.x, transform.location.y,
+                    collided_with_type is not None,
+                    collided_with_type if collided_with_type else 'None',
+                    anomaly_type
+                ))
+                log_rows += 1
+            except queue.Full: # Writer has fallen far behind; never stall the sim for it
+                dropped_log_rows += 1
             
             collision_state['collided_with'] = None
             pygame.display.flip()
@@ -234,28 +307,28 @@ def main():
         # --- Clean Up ---
         print("\nSimulation ended. Cleaning up...")
         pygame.quit() 
+
+        # Hand the clock back to the server, otherwise it stays frozen waiting for ticks
+        if original_settings is not None:
+            client.get_trafficmanager().set_synchronous_mode(False)
+            world.apply_settings(original_settings)
         
         if collision_sensor and collision_sensor.is_listening:
             collision_sensor.stop()
             
         # --- MODIFIED: Destroy BOTH actor lists ---
-        print(f"Destroying our vehicle and sensors ({len(actor_list)} actors)...")
-        if actor_list:
-            client.apply_batch([carla.command.DestroyActor(actor) for actor in actor_list])
-        
-        print(f"Destroying AI traffic ({len(traffic_actor_list)} actors)...")
-        if traffic_actor_list:
-            client.apply_batch([carla.command.DestroyActor(actor) for actor in traffic_actor_list])
+        print(f"Destroying our vehicle and sensors ({len(actor_list)} actors) "
+              f"and AI traffic ({len(traffic_actor_list)} actors)...")
+        failed = destroy_actors(client, actor_list + traffic_actor_list)
+        if failed:
+            print(f"Warning: {failed} actors could not be destroyed.")
         
-        # --- Save the log file (Unchanged) ---
-        if driving_log:
-            print(f"Writing {len(driving_log)} driving pattern entries to {log_filename}...")
-            headers = driving_log[0].keys() 
-            with open(log_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
-                writer.writerows(driving_log)
-            print(f"Successfully saved log to {log_filename}")
+        # --- Flush the streamed log ---
+        log_queue.put(None)
+        log_thread.join()
+        print(f"Saved {log_rows} driving pattern entries to {log_filename}")
+        if dropped_log_rows:
+            print(f"Warning: {dropped_log_rows} log entries were dropped (disk too slow).")
         
         print("Cleanup complete.")
 
@@ -0,0 +1,50 @@
+"""
+Train a dlib shape predictor for the eye and mouth landmarks only.
+
+voice_assistant.py only uses points 36-67 of the 68-point ibug layout. A
+predictor trained on just those 32 points evaluates far fewer regression
+trees per face. voice_assistant.py picks it up automatically when
+models/shape_predictor_eyes_mouth_32.dat exists.
+
+Usage (one-off, needs the iBUG 300-W dataset with dlib's training XML):
+    python train_eye_mouth_predictor.py path/to/ibug_300W_large_face_landmark_dataset
+"""
+
+import os
+import sys
+import multiprocessing
+import xml.etree.ElementTree as ET
+import dlib
+
+FIRST_PART, LAST_PART = 36, 67  # Eyes (36-47) and mouth (48-67)
+OUTPUT_MODEL = "models/shape_predictor_eyes_mouth_32.dat"
+
+def filter_parts(src_xml, dst_xml):
+    """Keep parts 36-67 of every box, renumbered 0-31."""
+    tree = ET.parse(src_xml)
+    for box in tree.iter("box"):
+        for part in list(box.findall("part")):
+            idx = int(part.get("name"))
+            if FIRST_PART <= idx <= LAST_PART:
+                part.set("name", f"{idx - FIRST_PART:02d}")
+            else:
+                box.remove(part)
+    tree.write(dst_xml)
+
+dataset_dir = sys.argv[1]
+train_xml = os.path.join(dataset_dir, "labels_ibug_300W_train_eyes_mouth.xml")
+test_xml = os.path.join(dataset_dir, "labels_ibug_300W_test_eyes_mouth.xml")
+filter_parts(os.path.join(dataset_dir, "labels_ibug_300W_train.xml"), train_xml)
+filter_parts(os.path.join(dataset_dir, "labels_ibug_300W_test.xml"), test_xml)
+
+options = dlib.shape_predictor_training_options()
+options.tree_depth = 4
+options.nu = 0.1
+options.cascade_depth = 15
+options.oversampling_amount = 20
+options.num_threads = multiprocessing.cpu_count()
+options.be_verbose = True
+
+dlib.train_shape_predictor(train_xml, OUTPUT_MODEL, options)
+print(f"Saved {OUTPUT_MODEL}")
+print("Test error:", dlib.test_shape_predictor(test_xml, OUTPUT_MODEL))
@@ -5,32 +5,65 @@ Features:
  - Real-time driver monitoring (drowsiness, emotion, attention)
  - Voice assistant with speech I/O and CARLA control
  - Live watchdog for driver-state liveness
- - Visual 'ACTIVE / OFFLINE' banner on OpenCV window
+ - Visual 'ACTIVE / OFFLINE' banner on OpenCV window (set VIGILANCE_UI=1)
 """
 
+import os
 import carla
 import cv2
 import dlib
 import time
+import math
 import numpy as np
 import threading
+import queue
+from collections import deque
+from dataclasses import dataclass
 import pyttsx3
 import speech_recognition as sr
 from imutils import face_utils
 from deepface import DeepFace
-from scipy.spatial import distance
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    print("Warning: numba not installed. Landmark math will run as plain Python/NumPy.")
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
 
 # ===============================
 # CONFIG
 # ===============================
 DLIB_MODEL = "models/shape_predictor_68_face_landmarks.dat"
+EYE_MOUTH_MODEL = "models/shape_predictor_eyes_mouth_32.dat"  # Optional, see train_eye_mouth_predictor.py
 EAR_THRESH = 0.22
 MAR_THRESH = 0.65
-FATIGUE_BLINK_LIMIT = 40
-EMOTION_INTERVAL = 30
+FATIGUE_BLINK_LIMIT = 40  # Blinks within BLINK_WINDOW that count as fatigue
+BLINK_WINDOW = 60.0  # seconds of blink history kept
+BLINK_MIN_CLOSED = 0.1  # seconds the eyes must stay closed for a closure to count as a blink
+EMOTION_INPUT_SIZE = (48, 48)  # Grayscale input of DeepFace's emotion CNN
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+FACE_DNN_PROTOTXT = "models/deploy.prototxt"
+FACE_DNN_MODEL = "models/res10_300x300_ssd_iter_140000.caffemodel"
+FACE_DNN_CONFIDENCE = 0.5
+MMOD_MODEL = "models/mmod_human_face_detector.dat"  # dlib CNN detector, used with a CUDA build of dlib
+DETECT_WIDTH = 320  # dlib fallback detector input width; landmarks still use the full frame
+DETECT_INTERVAL = 10  # Full face detection every Nth frame; the last box is reused in between
+MOTION_SIZE = (16, 16)  # Thumbnail of the eye/mouth part of the face box used to detect a still face
+MOTION_THRESH = 12  # Largest per-cell gray change (0-255) below which landmarks are reused
+FRAME_SKIP = 2  # Analyze every Nth camera frame (blinks/yawns last ~200 ms, 10-15 Hz is enough)
+FRAME_SKIP_MAX = 3  # Used while the analysis loop runs over budget
+FRAME_BUDGET = 0.08  # seconds per analyzed frame before skipping more
 SPEED_ALERT_THRESHOLD = 80.0  # km/h
+SPEED_CACHE_TTL = 1.0  # seconds a polled vehicle speed is reused
 VOICE_RATE = 170
 WATCHDOG_TIMEOUT = 10  # seconds before "offline" status
+SHOW_UI = os.environ.get("VIGILANCE_UI", "0") == "1"  # OpenCV monitor window
+UI_FPS = 10  # Monitor window refresh rate
 
 # ===============================
 # INIT: CARLA CONNECTION
@@ -55,8 +88,61 @@ print("Connected to:", vehicle.type_id)
 # ===============================
 # INIT: MODELS & SPEECH ENGINES
 # ===============================
-detector = dlib.get_frontal_face_detector()
-predictor = dlib.shape_predictor(DLIB_MODEL)
+if not getattr(dlib, "USE_AVX_INSTRUCTIONS", False) and not getattr(dlib, "USE_NEON_INSTRUCTIONS", False):
+    print("Warning: dlib was built without AVX/NEON – face detection/landmarks will be slow. "
+          "See doc/installation.md to rebuild it.")
+
+def load_face_dnn():
+    try:
+        net = cv2.dnn.readNetFromCaffe(FACE_DNN_PROTOTXT, FACE_DNN_MODEL)
+    except cv2.error:
+        print("SSD face model not found, falling back to dlib face detector.")
+        return None
+    if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+    else:
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+def load_dlib_detector():
+    """dlib's MMOD CNN detector on CUDA when available, else HOG; both return a list of rectangles."""
+    if getattr(dlib, "DLIB_USE_CUDA", False) and os.path.exists(MMOD_MODEL):
+        cnn_detector = dlib.cnn_face_detection_model_v1(MMOD_MODEL)
+        return lambda img, upsample: [d.rect for d in cnn_detector(img, upsample)]
+    return dlib.get_frontal_face_detector()
+
+cv2.setUseOptimized(True)  # SSE/AVX/NEON code paths in OpenCV
+cv2.setNumThreads(os.cpu_count() or 1)
+
+# Built once here and shared by analyze_driver; never construct these per frame
+face_net = load_face_dnn()
+detector = load_dlib_detector() if face_net is None else None
+# The 32-point eye/mouth predictor runs far fewer regression trees than the 68-point one;
+# both are read through the same 32-point layout (68-point indices 36-67)
+if os.path.exists(EYE_MOUTH_MODEL):
+    predictor, LANDMARK_START = dlib.shape_predictor(EYE_MOUTH_MODEL), 0
+else:
+    predictor, LANDMARK_START = dlib.shape_predictor(DLIB_MODEL), 36
+
+def load_emotion_model():
+    """Build DeepFace's emotion CNN once (FP16 compute when a GPU is present)."""
+    import tensorflow as tf
+    gpus = tf.config.list_physical_devices("GPU")
+    if gpus:
+        # One GPU, allocated on demand, so TF doesn't grab all VRAM next to CARLA
+        tf.config.set_visible_devices(gpus[0], "GPU")
+        tf.config.experimental.set_memory_growth(gpus[0], True)
+        try:
+            import tf_keras as keras  # DeepFace builds its models with tf_keras on TF >= 2.16
+        except ImportError:
+            keras = tf.keras
+        keras.mixed_precision.set_global_policy("mixed_float16")
+    emotion_client = DeepFace.build_model("Emotion", task="facial_attribute")
+    return getattr(emotion_client, "model", emotion_client)
+
+EMOTION_MODEL = load_emotion_model()
 
 engine = pyttsx3.init()
 engine.setProperty('rate', VOICE_RATE)
@@ -85,22 +171,101 @@ def listen():
 # ===============================
 # HELPER FUNCTIONS
 # ===============================
-def ear(eye):
-    A = distance.euclidean(eye[1], eye[5])
-    B = distance.euclidean(eye[2], eye[4])
-    C = distance.euclidean(eye[0], eye[3])
-    return (A + B) / (2.0 * C + 1e-8)
-
-def mar(mouth):
-    A = distance.euclidean(mouth[13], mouth[19])
-    B = distance.euclidean(mouth[14], mouth[18])
-    C = distance.euclidean(mouth[15], mouth[17])
-    D = distance.euclidean(mouth[12], mouth[16]) + 1e-8
-    return (A + B + C) / (3.0 * D)
-
+# Eye/mouth landmark pairs (0-11 eyes, 12-31 mouth): left eye (2 vertical, 1 horizontal),
+# right eye (same), inner mouth (3 vertical, 1 horizontal)
+RATIO_A_IDX = np.array([1, 2, 0, 7, 8, 6, 25, 26, 27, 24])
+RATIO_B_IDX = np.array([5, 4, 3, 11, 10, 9, 31, 30, 29, 28])
+
+def eye_mouth_ratios(shape):
+    """Average EAR of both eyes and the MAR, from one vectorized distance computation."""
+    d = np.linalg.norm((shape[RATIO_A_IDX] - shape[RATIO_B_IDX]).astype(np.float32), axis=1)
+    ear_l = (d[0] + d[1]) / (2.0 * d[2] + 1e-8)
+    ear_r = (d[3] + d[4]) / (2.0 * d[5] + 1e-8)
+    return (ear_l + ear_r) / 2.0, (d[6] + d[7] + d[8]) / (3.0 * (d[9] + 1e-8))
+
+@njit(cache=True)
+def blink_step(ear_avg, now, closed_since):
+    """Blink update -> (closed_since, blinked); a no-op for an implausible EAR.
+
+    closed_since is the timestamp (s) of the first closed-eye frame, or -1.0 while the eyes
+    are open. A blink is counted when the eyes reopen after at least BLINK_MIN_CLOSED, so
+    the rule doesn't depend on how many frames were analyzed in between.
+    """
+    if not 0.0 < ear_avg < 1.0:
+        return closed_since, 0
+    # Branch-free: 0/1 flags select the new timestamp instead of if/else resets
+    closed = int(ear_avg <= EAR_THRESH)
+    was_closed = int(closed_since >= 0.0)
+    blinked = (1 - closed) * was_closed * int(now - closed_since >= BLINK_MIN_CLOSED)
+    closed_since = closed * (was_closed * closed_since + (1 - was_closed) * now) - (1 - closed)
+    return closed_since, blinked
+
+# process_landmarks(pts, now, closed_since) -> (ear_avg, mar_val, closed_since, blinked)
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _dist(p, i, j):
+        dx = p[i, 0] - p[j, 0]
+        dy = p[i, 1] - p[j, 1]
+        return math.sqrt(dx * dx + dy * dy)
+
+    @njit(cache=True, fastmath=True)
+    def process_landmarks(pts, now, closed_since):
+        ear_l = (_dist(pts, 1, 5) + _dist(pts, 2, 4)) / (2.0 * _dist(pts, 0, 3) + 1e-8)
+        ear_r = (_dist(pts, 7, 11) + _dist(pts, 8, 10)) / (2.0 * _dist(pts, 6, 9) + 1e-8)
+        ear_avg = (ear_l + ear_r) / 2.0
+        mar_val = (_dist(pts, 25, 31) + _dist(pts, 26, 30) + _dist(pts, 27, 29)) / (3.0 * (_dist(pts, 24, 28) + 1e-8))
+        closed_since, blinked = blink_step(ear_avg, now, closed_since)
+        return ear_avg, mar_val, closed_since, blinked
+
+    # Compile now so analyze_driver never pays the JIT cost
+    process_landmarks(np.zeros((32, 2), dtype=np.float32), 0.0, -1.0)
+else:
+    def process_landmarks(pts, now, closed_since):
+        ear_avg, mar_val = eye_mouth_ratios(pts)
+        closed_since, blinked = blink_step(ear_avg, now, closed_since)
+        return ear_avg, mar_val, closed_since, blinked
+
+def scale_rect(rect, factor):
+    return dlib.rectangle(int(rect.left() * factor), int(rect.top() * factor),
+                          int(rect.right() * factor), int(rect.bottom() * factor))
+
+def detect_face_dnn(net, frame):
+    """Returns the most confident face in a BGRA frame as a dlib.rectangle, or None."""
+    h, w = frame.shape[:2]
+    # Drop alpha after the resize, on 300x300 pixels instead of the full frame
+    small = cv2.cvtColor(cv2.resize(frame, (300, 300)), cv2.COLOR_BGRA2BGR)
+    blob = cv2.dnn.blobFromImage(small, 1.0, (300, 300), (104.0, 177.0, 123.0))
+    net.setInput(blob)
+    detections = net.forward()[0, 0]
+    best = int(np.argmax(detections[:, 2]))
+    if detections[best, 2] < FACE_DNN_CONFIDENCE:
+        return None
+    x0, y0, x1, y1 = detections[best, 3:7] * (w, h, w, h)
+    return dlib.rectangle(max(0, int(x0)), max(0, int(y0)), min(w - 1, int(x1)), min(h - 1, int(y1)))
+
+def face_thumbnail(gray, rect, dst):
+    """Shrinks the eye-to-chin part of rect into dst; False if the box is off-frame.
+
+    Each thumbnail cell covers a patch of a few eye widths or less, so a closing eye or
+    opening mouth changes whole cells instead of vanishing in a frame-wide mean.
+    """
+    top = max(0, rect.top() + rect.height() // 5)
+    roi = gray[top:rect.bottom(), max(0, rect.left()):rect.right()]
+    if roi.size == 0:
+        return False
+    cv2.resize(roi, MOTION_SIZE, dst=dst, interpolation=cv2.INTER_AREA)
+    return True
+
+speed_cache = (0.0, 0.0)  # (km/h, time polled)
 def get_speed():
-    v = vehicle.get_velocity()
-    return 3.6 * (v.x*2 + v.y2 + v.z2)*0.5
+    global speed_cache
+    speed, polled = speed_cache
+    now = time.time()
+    if now - polled > SPEED_CACHE_TTL:
+        v = vehicle.get_velocity()
+        speed = 3.6 * math.sqrt(v.x * v.x + v.y * v.y + v.z * v.z)
+        speed_cache = (speed, now)
+    return speed
 
 # ===============================
 # CAMERA SETUP
@@ -114,86 +279,195 @@ cam_bp.set_attribute("fov", "90")
 camera_transform = carla.Transform(carla.Location(x=1.5, z=2.4))
 camera = world.spawn_actor(cam_bp, camera_transform, attach_to=vehicle)
 
-frame = None
+# Only the newest image is kept (a CARLA sensor has no capture buffer to shrink); it is
+# converted by analyze_driver, so frames it skips cost nothing and the stream never backs up
+latest_image = None
+frame_cv = threading.Condition()  # Notified on every new image
 def camera_callback(image):
-    global frame
-    array = np.frombuffer(image.raw_data, dtype=np.uint8)
-    frame = array.reshape((image.height, image.width, 4))[:, :, :3]
+    global latest_image
+    with frame_cv:
+        latest_image = image
+        frame_cv.notify_all()
 camera.listen(camera_callback)
 
 # ===============================
 # GLOBAL STATES
 # ===============================
-driver_state = {"state": "unknown", "emotion": "unknown"}
-last_emotion = "unknown"
-blink_count = 0
-consec_blink_frames = 0
-prev_ear = 1.0
-frame_idx = 0
+@dataclass(slots=True)
+class DriverState:
+    state: str = "unknown"  # Written only by analyze_driver
+    emotion: str = "unknown"  # Written only by emotion_worker
+
+driver_state = DriverState()
+blink_count = 0  # Blinks within the last BLINK_WINDOW seconds
+blink_times = deque()  # Image timestamps of those blinks
+closed_since = -1.0  # Timestamp the eyes closed at, -1.0 while open
+last_rect = None  # Driver's face box from the last detection
+emotion_q = queue.Queue(maxsize=1)  # Newest face crop for the emotion worker
+frames_since_detect = 0
 last_analysis_time = time.time()
 module_alive = True
+display_q = queue.Queue(maxsize=1)  # Newest annotated frame for the monitor window
+stop_event = threading.Event()  # Set by the "exit" command or 'q' in the window
 
 # ===============================
-# DRIVER ANALYSIS THREAD
+# EMOTION WORKER THREAD
 # ===============================
-def analyze_driver():
-    global blink_count, consec_blink_frames, prev_ear, frame_idx
-    global last_emotion, last_analysis_time, driver_state, module_alive
+def submit_emotion(face):
+    """Queue a crop for the worker, replacing one it hasn't picked up yet."""
+    try:
+        emotion_q.get_nowait()
+    except queue.Empty:
+        pass
+    emotion_q.put_nowait(face)
 
+def emotion_worker():
+    """Classifies the newest face crop as fast as the model allows, off the analysis loop."""
+    last_error = None
     while True:
-        if frame is None:
-            time.sleep(0.05)
+        face = emotion_q.get()  # Already a non-empty EMOTION_INPUT_SIZE gray crop
+        batch = face.astype(np.float32)[None, ..., None] / 255.0
+        try:
+            probs = EMOTION_MODEL.predict_on_batch(batch)
+        except Exception as e:
+            if repr(e) != last_error:  # Print each distinct failure once, not every frame
+                print("Emotion inference failed:", e)
+                last_error = repr(e)
             continue
+        last_error = None
+        driver_state.emotion = EMOTION_LABELS[int(np.argmax(probs[0]))]
 
-        current = frame.copy()
-        gray = cv2.cvtColor(current, cv2.COLOR_BGR2GRAY)
-        rects = detector(gray, 0)
-        frame_idx += 1
+# ===============================
+# DISPLAY THREAD
+# ===============================
+def display_worker():
+    """Shows annotated frames at UI_FPS so imshow/waitKey stay off the analysis loop."""
+    while not stop_event.is_set():
+        try:
+            img = display_q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        cv2.imshow("Vigilance AI - Driver Monitor", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            stop_event.set()
+        time.sleep(1.0 / UI_FPS)
+    cv2.destroyAllWindows()
 
-        drowsy = "Unknown"
-        emotion = last_emotion
+# ===============================
+# DRIVER ANALYSIS THREAD
+# ===============================
+def analyze_driver():
+    global blink_count, closed_since
+    global last_analysis_time, module_alive
+    global last_rect, frames_since_detect
+
+    gray = None
+    bgr_bufs, buf_idx = None, 0
+    motion_small = np.empty(MOTION_SIZE[::-1], dtype=np.uint8)
+    motion_ref = np.empty_like(motion_small)  # Face thumbnail of the frame the landmarks came from
+    cached_ratios = None  # (ear_avg, mar_val) from the last full detect/predict pass
+    last_id = None
+    frames_seen = 0
+    frame_skip = FRAME_SKIP
+    latency_ema = 0.0
+    while not stop_event.is_set():
+        # Woken by the camera callback instead of polling; the timeout keeps stop_event checked
+        with frame_cv:
+            frame_cv.wait_for(lambda: latest_image is not None and latest_image.frame != last_id, timeout=1.0)
+            image = latest_image
+        if image is None or image.frame == last_id:
+            continue
+        last_id = image.frame
+        # Count frames seen rather than using the CARLA id, which need not be consecutive
+        frames_seen += 1
+        if frames_seen % frame_skip:
+            continue
+        start = time.perf_counter()
+        now = image.timestamp  # Simulation seconds; blink timing is independent of the skip
+
+        array = np.frombuffer(image.raw_data, dtype=np.uint8).reshape((image.height, image.width, 4))
+        if gray is None or gray.shape != array.shape[:2]:
+            gray = np.empty(array.shape[:2], dtype=np.uint8)  # Reused every frame
+            if SHOW_UI:
+                # Two BGR buffers so the one queued for display isn't overwritten
+                bgr_bufs = [np.empty(array.shape[:2] + (3,), dtype=np.uint8) for _ in range(2)]
+        # Analysis only needs gray; the full-size BGR frame is built only for the monitor window
+        cv2.cvtColor(array, cv2.COLOR_BGRA2GRAY, dst=gray)
+
+        # Eyes and mouth unchanged since the landmarks were last computed (e.g. highway
+        # cruising): reuse their EAR/MAR and skip detection and the predictor
+        if (cached_ratios is not None and face_thumbnail(gray, last_rect, motion_small)
+                and cv2.absdiff(motion_small, motion_ref).max() < MOTION_THRESH):
+            closed_since, blinked = blink_step(cached_ratios[0], now, closed_since)
+            if blinked:
+                blink_times.append(now)
+            rects = []
+        else:
+            cached_ratios = None
+            # Detection is the expensive step: run it every DETECT_INTERVAL frames (or once the
+            # face is lost) and track the driver with the previous box in between
+            if last_rect is None or frames_since_detect >= DETECT_INTERVAL:
+                if face_net is not None:
+                    last_rect = detect_face_dnn(face_net, array)
+                else:
+                    # dlib detector on a downscaled copy, boxes mapped back so landmarks use full resolution
+                    scale = gray.shape[1] / DETECT_WIDTH
+                    small_gray = cv2.resize(gray, (DETECT_WIDTH, int(gray.shape[0] / scale)), interpolation=cv2.INTER_AREA)
+                    faces = detector(small_gray, 0)
+                    last_rect = scale_rect(faces[0], scale) if len(faces) else None
+                frames_since_detect = 0
+            frames_since_detect += 1
+            rects = [last_rect] if last_rect is not None else []
 
         for rect in rects:
-            shape = predictor(gray, rect)
-            shape = face_utils.shape_to_np(shape)
-            lEye, rEye, mouth = shape[36:42], shape[42:48], shape[48:68]
-            ear_avg = (ear(lEye) + ear(rEye)) / 2.0
-            mar_val = mar(mouth)
-
-            if prev_ear > EAR_THRESH and ear_avg <= EAR_THRESH:
-                consec_blink_frames += 1
-            else:
-                consec_blink_frames = 0
-            if consec_blink_frames >= 3:
-                blink_count += 1
-                consec_blink_frames = 0
-            prev_ear = ear_avg
+            pts = face_utils.shape_to_np(predictor(gray, rect), dtype="float32")[LANDMARK_START:]
+            ear_avg, mar_val, closed_since, blinked = process_landmarks(pts, now, closed_since)
+            if not 0.0 < ear_avg < 1.0:
+                # Landmarks fitted to a stale box; drop it and re-detect next frame
+                last_rect = None
+                continue
+            if blinked:
+                blink_times.append(now)
+            if face_thumbnail(gray, rect, motion_ref):
+                cached_ratios = (ear_avg, mar_val)
+
+            face = gray[max(0, rect.top()):rect.bottom(), max(0, rect.left()):rect.right()]
+            if face.size:
+                submit_emotion(cv2.resize(face, EMOTION_INPUT_SIZE, interpolation=cv2.INTER_AREA))
+
+        while blink_times and now - blink_times[0] > BLINK_WINDOW:
+            blink_times.popleft()
+        blink_count = len(blink_times)
 
+        drowsy = "Unknown"
+        if cached_ratios is not None:
+            ear_avg, mar_val = cached_ratios
             yawn = mar_val > MAR_THRESH
             drowsy = "Drowsy" if ear_avg < EAR_THRESH or yawn or blink_count > FATIGUE_BLINK_LIMIT else "Alert"
-
-            if frame_idx % EMOTION_INTERVAL == 0:
-                try:
-                    res = DeepFace.analyze(current, actions=['emotion'], enforce_detection=False)
-                    emotion = res[0]["dominant_emotion"] if isinstance(res, list) else res["dominant_emotion"]
-                except:
-                    pass
-                last_emotion = emotion
-
-        driver_state["state"] = drowsy.lower()
-        driver_state["emotion"] = emotion.lower()
+        driver_state.state = drowsy.lower()
         last_analysis_time = time.time()
 
-        # Visual overlay
-        status_color = (0, 255, 0) if module_alive else (0, 0, 255)
-        status_text = "ACTIVE" if module_alive else "OFFLINE"
-        cv2.putText(current, f"Status: {status_text}", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-        cv2.putText(current, f"State: {drowsy} | Emotion: {emotion}", (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-        cv2.imshow("Vigilance AI - Driver Monitor", current)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-        time.sleep(0.05)
+        # Visual overlay, handed to the display thread (an unshown older frame is dropped)
+        if SHOW_UI:
+            current = bgr_bufs[buf_idx]
+            buf_idx ^= 1
+            cv2.cvtColor(array, cv2.COLOR_BGRA2BGR, dst=current)
+            status_color = (0, 255, 0) if module_alive else (0, 0, 255)
+            status_text = "ACTIVE" if module_alive else "OFFLINE"
+            cv2.putText(current, f"Status: {status_text}", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+            cv2.putText(current, f"State: {drowsy} | Emotion: {driver_state.emotion}", (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+            try:
+                display_q.get_nowait()
+            except queue.Empty:
+                pass
+            display_q.put_nowait(current)
+
+        # Skip more frames while the loop can't keep up, back off once it recovers
+        latency_ema = 0.9 * latency_ema + 0.1 * (time.perf_counter() - start)
+        if latency_ema > FRAME_BUDGET:
+            frame_skip = FRAME_SKIP_MAX
+        elif latency_ema < FRAME_BUDGET / 2:
+            frame_skip = FRAME_SKIP
 
 # ===============================
 # VOICE ASSISTANT THREAD
@@ -215,7 +489,7 @@ def voice_assistant():
                 speak("Driver analysis module is back online.")
                 module_alive = True
 
-            state, emotion = driver_state["state"], driver_state["emotion"]
+            state, emotion = driver_state.state, driver_state.emotion
             speed = get_speed()
 
             if state != last_state:
@@ -244,16 +518,15 @@ def voice_assistant():
 # COMMAND LISTENER THREAD
 # ===============================
 def command_listener():
-    while True:
+    while not stop_event.is_set():
         cmd = listen()
         if not cmd:
             continue
 
-        speed = get_speed()
         if "speed" in cmd:
-            speak(f"Your current speed is {speed:.1f} kilometers per hour.")
+            speak(f"Your current speed is {get_speed():.1f} kilometers per hour.")
         elif "how am i" in cmd or "driver" in cmd:
-            speak(f"You are {driver_state['state']} and seem {driver_state['emotion']}.")
+            speak(f"You are {driver_state.state} and seem {driver_state.emotion}.")
         elif "stop" in cmd:
             vehicle.apply_control(carla.VehicleControl(throttle=0.0, brake=1.0))
             speak("Vehicle stopped.")
@@ -262,16 +535,35 @@ def command_listener():
             speak("Resuming drive.")
         elif "exit" in cmd or "quit" in cmd:
             speak("Shutting down Vigilance AI. Drive safe.")
+            stop_event.set()
             break
         time.sleep(0.5)
 
 # ===============================
 # MAIN
 # ===============================
+def warm_up_models():
+    """One dummy pass through each model so the first real frame doesn't pay CUDA/graph setup."""
+    print("dlib CUDA:", getattr(dlib, "DLIB_USE_CUDA", False))
+    try:
+        EMOTION_MODEL.predict_on_batch(np.zeros((1,) + EMOTION_INPUT_SIZE[::-1] + (1,), dtype=np.float32))
+        blank = np.zeros((100, 100), dtype=np.uint8)
+        predictor(blank, dlib.rectangle(0, 0, 99, 99))
+        if face_net is not None:
+            detect_face_dnn(face_net, np.zeros((300, 300, 4), dtype=np.uint8))
+        else:
+            detector(blank, 0)
+    except Exception as e:
+        print("Model warm-up failed:", e)
+
 def main():
+    warm_up_models()
     speak("Vigilance AI monitoring and live-check assistant activated.")
+    threading.Thread(target=emotion_worker, daemon=True).start()
     threading.Thread(target=analyze_driver, daemon=True).start()
     threading.Thread(target=voice_assistant, daemon=True).start()
+    if SHOW_UI:
+        threading.Thread(target=display_worker, daemon=True).start()
     command_listener()
 
 if __name__ == "__main__":